@@ -1,7 +1,10 @@
 import math
+import heapq
+from collections import deque
 import datetime as dt
 import output_options as oo
 import hq
+import availability
 import helper as h
 from simpy.util import start_delayed
 
@@ -21,8 +24,6 @@ class StartFU(object):
         self.district = district
         self.update = self.district.input_data['RMT_update']
 
-        self.visit_list = []
-
         self.env.process(self.create_visit_lists())
 
     def create_visit_lists(self):
@@ -30,16 +31,6 @@ class StartFU(object):
         if h.responses_to_date(self.district) < self.district.input_data["trigger"]:
             # only create action plans if the target rate has not been reached
 
-            self.visit_list = []
-
-            self.visit_list = [household for household in self.district.households
-                               if not household.responded
-                               and household.visits < household.input_data['max_visits']
-                               and h.time_from_start(self.district.rep, household.input_data['FU_start_date']) <= self.env.now]
-
-            # order by priority
-            self.visit_list.sort(key=lambda hh: hh.priority, reverse=False)
-
             j = 0
             temp_co_list = []
             for co in self.district.district_co:
@@ -47,11 +38,12 @@ class StartFU(object):
                     temp_co_list.append(co)
 
             num_of_co = len(temp_co_list)
-            action_plan_list = []
+            action_plan_list = [ActionPlan() for i in range(num_of_co)]
 
-            for i in range(num_of_co):
-                action_plan = self.visit_list[i::num_of_co]
-                action_plan_list.append(action_plan)
+            if num_of_co:
+                # dealt in turn from the visit queue, ordered by priority
+                for i, household in enumerate(self.district.hh_table.to_visit(self.env.now)):
+                    action_plan_list[i % num_of_co].append(household)
 
             #if co.rep.districts[0].district == "1":
             #    print("time ", self.env.now, " action plans", len(action_plan_list), " co's ", len(temp_co_list))
@@ -66,11 +58,84 @@ class StartFU(object):
         else:
             # returns to date over trigger point so no need to do any more FU...
             for co in self.district.district_co:
-                co.action_plan = []
+                co.action_plan = ActionPlan()
 
             self.district.district_co = []
 
 
+class ActionPlan(object):
+    """the households a CO is to visit, in the order they are visited. A household that has arranged a visit is parked
+    in a bucket for the next hour that is the best time to visit it, rather than being moved back in the plan, and is
+    visited first once that hour comes"""
+
+    def __init__(self, households=()):
+
+        self.visits = deque(households)
+        self.parked = {}  # households parked for each sim hour
+        self.hours = []  # heap of the hours households are parked for
+        self.parked_count = 0
+
+    def __len__(self):
+        return len(self.visits) + self.parked_count
+
+    def append(self, household):
+        """adds the passed household to the end of the plan"""
+
+        self.visits.append(household)
+
+    def park(self, household, hour):
+        # parks the household until the passed sim hour
+
+        if hour not in self.parked:
+            self.parked[hour] = deque()
+            heapq.heappush(self.hours, hour)
+
+        self.parked[hour].append(household)
+        self.parked_count += 1
+
+    def unpark(self):
+        # returns the household parked longest for the earliest hour
+
+        hour = self.hours[0]
+        bucket = self.parked[hour]
+        household = bucket.popleft()
+
+        if not bucket:
+            heapq.heappop(self.hours)
+            del self.parked[hour]
+
+        self.parked_count -= 1
+
+        return household
+
+    def next_visit(self, time, live=False):
+        """returns the next household to visit at the passed time, None if there are none. If live households that
+        have sent a return are skipped"""
+
+        while self:
+            if self.hours and self.hours[0] <= time:
+                household = self.unpark()
+            elif self.visits:
+                household = self.visits.popleft()
+            else:
+                # only households parked for later hours are left
+                household = self.unpark()
+
+            if live and household.return_received:
+                continue
+
+            elif household.arranged_visit and self.visits and not household.optimal_time():
+                # park until the best time to visit unless there are no other households to visit
+                hour = household.next_optimal_time()
+                if hour is not None:
+                    self.park(household, hour)
+                    continue
+
+            return household
+
+        return None
+
+
 class CensusOfficer(object):
     """represents an individual Census Officer. Each instance can be different"""
 
@@ -82,12 +147,13 @@ class CensusOfficer(object):
         self.input_data = input_data
         self.co_id = co_id
 
-        self.rnd = self.rep.rnd
-        self.action_plan = []
+        self.rnd = self.rep.streams.visit
+        self.action_plan = ActionPlan()
         self.start_date = dt.datetime.strptime((self.input_data['start_date']), '%Y, %m, %d').date()
         self.end_date = dt.datetime.strptime((self.input_data['end_date']), '%Y, %m, %d').date()
         self.has_pq = h.str2bool(self.input_data['has_pq'])
         self.has_postcard = h.str2bool(self.input_data['has_postcard'])
+        self.calendar = availability.calendar(self.input_data['availability'])
         self.start_sim_time = h.get_entity_time(self)  # self.co_start_time()  # the sim time the co starts work
         self.end_sim_time = h.get_entity_time(self, "end")  # self.co_end_time()  # the sim time the co ends work
 
@@ -95,44 +161,10 @@ class CensusOfficer(object):
         # start work at correct time
         start_delayed(self.env, self.co_working_test(), self.start_sim_time)
 
-    def optimal_time(self, household):
-        # determines if the current time is the best time to visit a hh that has asked for a visit
-
-        # get times avail
-        d = household.input_data['contact_rate'][str(h.current_day(household))]
-
-        # if current time is not best time don't visit
-        if d[h.return_time_key(d, self.env.now)] != d[max(d, key=d.get)]:
-            return False
-        else:
-            # visit
-            return True
-
     def return_next_visit(self, live=False):
         # if live tests if a return has been received since the action plans have been created.
 
-        # add a check to see if the hh has requested a visit - if yes go at optimal time for hh type
-        if self.action_plan:
-            household = self.action_plan.pop(0)
-        else:
-            return None
-
-        if live and household.returned:
-            return self.return_next_visit(live)
-        elif household.arranged_visit and not self.optimal_time(household):
-            # put hh back in list at correct place and then get the next one...unless no other hh to visit
-            if self.action_plan:
-                print(household.hh_id)
-                try:
-                    self.action_plan.insert(10, household)
-                except ReferenceError:
-                    print('error')
-            else:
-                return household
-
-            return self.return_next_visit(live)
-        else:
-            return household
+        return self.action_plan.next_visit(self.env.now, live)
 
     def co_working_test(self):
 
@@ -162,9 +194,8 @@ class CensusOfficer(object):
         # tests if hh is in or is converted to a return!
 
         test_value = self.rnd.uniform(0, 100)
-        dict_value = household.input_data[input_type][str(h.current_day(self))]
 
-        if test_value <= dict_value[h.return_time_key(dict_value, self.env.now)]:
+        if test_value <= household.rate(input_type):
             return True
         else:
             return False
@@ -480,64 +511,36 @@ class CensusOfficer(object):
 
         day_of_week = h.current_day(self)
 
-        if self.start_sim_time <= self.env.now < self.end_sim_time and \
-                self.input_data['availability'][str(day_of_week)]:
-
-            for i in range(0, len(self.input_data['availability'][str(day_of_week)]), 2):
+        if self.start_sim_time <= self.env.now < self.end_sim_time:
 
-                start_time = dt.time(*map(int, self.input_data['availability'][str(day_of_week)][i].split(':')))
-                end_time = dt.time(*map(int, self.input_data['availability'][str(day_of_week)][i+1].split(':')))
+            for start_time, end_time in self.calendar.shifts(day_of_week):
 
-                start_sim_time = h.make_time_decimal(start_time) + math.floor(self.env.now/24)*24
-                end_sim_time = h.make_time_decimal(end_time) + math.floor(self.env.now / 24) * 24
+                start_sim_time = start_time + math.floor(self.env.now/24)*24
+                end_sim_time = end_time + math.floor(self.env.now / 24) * 24
 
                 if start_sim_time <= self.env.now < end_sim_time:
                     return True
 
         return False
 
-    def return_index(self):
-
-        return_index = 0
-
-        for household in self.action_plan:
-
-            if not household.arranged_visit:
-
-                return_index = self.action_plan.index(household) + 1
-
-        return max(return_index, 0)
-
-    def return_dow(self, days_gone_from_start, original_tod, count=0):
-        # get next relevant dow based on current sim time
-
-        current_dow = (self.rep.start_date + dt.timedelta(days=days_gone_from_start)).weekday()
-
-        if (not self.input_data['availability'][str(current_dow)] or
-           h.str_to_dec(self.input_data['availability'][str(current_dow)][-1]) <= original_tod):
-            # empty list
-            return self.return_dow(days_gone_from_start + 1, 0, count + 1)
-        else:
-            # not empty
-            return [str(current_dow), count]
-
     def next_available(self):
         """return the number of hours until the CO is next available or remove from sim if finished"""
 
         if self.env.now > self.end_sim_time:
             return self.rep.sim_hours - self.env.now
 
-        current_dow = (self.rep.start_date + dt.timedelta(days=math.floor(self.env.now / 24))).weekday()
-        dow = self.return_dow(math.floor(self.env.now / 24), self.env.now % 24)
+        current_dow = h.current_day(self)
+        # get next relevant dow based on current sim time
+        dow, count = self.calendar.next_working_day(math.floor(self.env.now / 24), self.env.now % 24,
+                                                    self.rep.start_day)
         # if action plan is zero,so no houses to visits always delay to the start of the next valid day
         if not self.action_plan:
             # this actually just jumps it to the end of the day
             return 24 - self.env.now % 24
 
-        elif int(dow[0]) == current_dow:
+        elif dow == current_dow:
 
-            return h.str_to_dec(self.input_data['availability'][str(dow[0])][-2]) - self.env.now % 24
+            return self.calendar.starts[dow][-1] - self.env.now % 24
         else:
 
-            return ((24 - self.env.now % 24) + (int(dow[1]) - 1) * 24 + h.str_to_dec(self.input_data['availability']
-                                                                                     [str(dow[0])][0]))
+            return (24 - self.env.now % 24) + (count - 1) * 24 + self.calendar.starts[dow][0]
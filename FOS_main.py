@@ -1,16 +1,22 @@
 """Main control file"""
 import json
 import datetime as dt
-import random
 import simpy
 import initialise
 import os
 import shutil
 import post_process as pp
-import copy
+import scheduler
+import checkpoint
+import adaptive
+import random_streams as rs
+import telemetry
+import profiling
+import instrumentation
+import memory_profiling
+import queue
 from collections import defaultdict
-from itertools import repeat
-from multiprocessing import cpu_count, Pool, freeze_support, Lock
+from multiprocessing import cpu_count, Pool, freeze_support, Lock, Queue
 import helper as hp
 import pandas as pd
 import output_options as oo
@@ -18,12 +24,17 @@ import glob
 import gzip
 import logging
 import traceback
+import time
 
 import matplotlib.pyplot as plt
 plt.style.use('ggplot')
 
 l = Lock()
 
+# sim files parsed by the current process. Workers are sent only the sim file, run and rep so each sim file is
+# loaded once per process rather than copied and pickled for every rep
+run_cache = {}
+
 
 def start_run(run_input, seeds, out_path):
 
@@ -170,96 +181,109 @@ def start_run(run_input, seeds, out_path):
 
     output_data = defaultdict(list)
 
-    rnd = random.Random()
-    rnd.seed(str(seeds))
-
-    # define simpy env for current rep
-    env = simpy.Environment()
-
-    # initialise replication
-    initialise.Rep(env,
-                   run_input,
-                   output_data,
-                   passive_summary,
-                   passive_totals,
-                   active_summary,
-                   active_totals,
-                   active_paper_summary,
-                   active_paper_totals,
-                   visit_summary,
-                   visit_totals,
-                   time_summary,
-                   time_totals,
-                   paper_summary,
-                   paper_totals,
-                   rnd,
-                   sim_hours,
-                   start_date,
-                   census_day,
-                   out_path,
-                   max_output_file_size)
-
-    # and run it
-    env.run(until=sim_hours)
-
-    # write the output to csv files
-    hp.write_output(output_data, out_path, run_input['run_id'])
-
-    # write summary data to csv to defined folder in main outputs
-    summary_path = os.path.join(out_path, 'summary')
-
-    c_run = run_input['run_id']
-    c_rep = run_input['rep_id']
+    # a single stream unless the run uses common random numbers
+    streams = rs.rep_streams(run_input, seeds)
+
+    # define simpy env for current rep - instrumented if the event counts are to be recorded
+    if oo.record_engine_stats:
+        env = instrumentation.InstrumentedEnvironment()
+    else:
+        env = simpy.Environment()
+
+    # snapshots of memory use at each phase of the rep if turned on
+    memory_snapshots = None
+    if memory_profiling.profile_memory:
+        memory_snapshots = memory_profiling.PhaseSnapshots(sum([hh_value['number']
+                                                                for d_value in run_input['districts'].values()
+                                                                for hh_value in d_value['households'].values()]))
+
+    # tracing is stopped even if the rep fails so later tasks of the worker are not slowed
+    try:
+        # initialise replication
+        initialise.Rep(env,
+                       run_input,
+                       output_data,
+                       passive_summary,
+                       passive_totals,
+                       active_summary,
+                       active_totals,
+                       active_paper_summary,
+                       active_paper_totals,
+                       visit_summary,
+                       visit_totals,
+                       time_summary,
+                       time_totals,
+                       paper_summary,
+                       paper_totals,
+                       streams,
+                       sim_hours,
+                       start_date,
+                       census_day,
+                       out_path,
+                       max_output_file_size,
+                       memory_snapshots)
+
+        if memory_snapshots:
+            env.process(memory_snapshots.census_day(env, census_day))
+
+        # and run it - sending heartbeats to the parent if it is collecting them
+        telemetry.run_env(env, sim_hours, run_input['run_id'], run_input['rep_id'])
+
+        if memory_snapshots:
+            memory_snapshots.take('end of sim')
+
+        if oo.record_engine_stats:
+            env.record(output_data, run_input['rep_id'])
+
+        # write the output to csv files
+        hp.write_output(output_data, out_path, run_input['run_id'])
+
+        if memory_snapshots:
+            memory_snapshots.take('output written')
+            memory_snapshots.report(memory_profiling.report_path(out_path, run_input['run_id'], run_input['rep_id']))
+
+    finally:
+        if memory_snapshots:
+            memory_snapshots.stop()
+
+    # return the summary data to the parent as arrays to be combined with the other reps rather than writing it
+    summaries = {}
 
     if oo.record_passive_summary:
 
-        hp.output_summary(summary_path, passive_summary, 'passive_summary', c_run, c_rep)
-        hp.output_summary(summary_path, passive_totals, 'passive_totals', c_run, c_rep)
+        summaries['passive_summary'] = hp.summary_to_arrays(passive_summary)
+        summaries['passive_totals'] = hp.summary_to_arrays(passive_totals)
 
     if oo.record_active_summary:
 
-        hp.output_summary(summary_path, active_summary, 'active_summary', c_run, c_rep)
-        hp.output_summary(summary_path, active_totals, 'active_totals', c_run, c_rep)
+        summaries['active_summary'] = hp.summary_to_arrays(active_summary)
+        summaries['active_totals'] = hp.summary_to_arrays(active_totals)
 
     if oo.record_active_paper_summary:
-        hp.output_summary(summary_path, active_paper_summary, 'active_paper_summary', c_run, c_rep)
-        hp.output_summary(summary_path, active_paper_totals, 'active_paper_totals', c_run, c_rep)
+        summaries['active_paper_summary'] = hp.summary_to_arrays(active_paper_summary)
+        summaries['active_paper_totals'] = hp.summary_to_arrays(active_paper_totals)
 
     if oo.record_visit_summary:
 
-        hp.output_summary(summary_path, visit_summary, 'visit_summary', c_run, c_rep)
-        hp.output_summary(summary_path, visit_totals, 'visit_totals', c_run, c_rep)
+        summaries['visit_summary'] = hp.summary_to_arrays(visit_summary)
+        summaries['visit_totals'] = hp.summary_to_arrays(visit_totals)
 
     if oo.record_time_summary:
 
-        hp.output_summary(summary_path, time_summary, 'time_summary', c_run, c_rep)
-        hp.output_summary(summary_path, time_totals, 'time_totals', c_run, c_rep)
+        summaries['time_summary'] = hp.summary_to_arrays(time_summary)
+        summaries['time_totals'] = hp.summary_to_arrays(time_totals)
 
     if oo.record_paper_summary:
 
-        hp.output_summary(summary_path, paper_summary, 'paper_summary', c_run, c_rep)
-        hp.output_summary(summary_path, paper_totals, 'paper_totals', c_run, c_rep)
+        summaries['paper_summary'] = hp.summary_to_arrays(paper_summary)
+        summaries['paper_totals'] = hp.summary_to_arrays(paper_totals)
+
+    return summaries
 
 
 def produce_default_output(input_path):
     """Produces default charts and outputs if turned on. If not leaves the raw data untouched."""
 
-    try:
-        print('Rationalising log files')
-        # combine output files
-        current_path = os.path.join(input_path, 'summary')
-        folders = next(os.walk(current_path))[1]
-        folders = [os.path.join(current_path, folder) for folder in folders]
-
-        pp_pool = Pool(cpu_count())
-        pp_pool.starmap(pp.produce_rep_results, zip(folders))
-        pp_pool.close()
-        pp_pool.join()
-
-    except:
-
-        print('failed in post processing')
-
     # produce a plot of the active and passive using bokeh
     print('Producing response plots')
     active_response_path = os.path.join(input_path, 'summary', 'active_summary', 'digital', 'average.csv')
@@ -293,12 +317,326 @@ def produce_default_output(input_path):
     pp.sum_pyramid(pandas_data['hh_record'], summary_outpath, input_left, input_right, name_left, name_right, bin_size=2)
 
 
+
+
+def load_run(sim, run_id, rep_id):
+    """returns the input for the passed run and rep of the passed sim file. The sim file is only read the first
+    time it is needed by the current process"""
+
+    if sim not in run_cache:
+        with open(sim) as data_file:
+            run_cache[sim] = json.load(data_file)
+
+    # the input is not changed by a rep so only the top level is copied to add the run and rep
+    run_input = dict(run_cache[sim][run_id])
+    run_input['run_id'] = run_id
+    run_input['rep_id'] = rep_id
+
+    return run_input
+
+
+def start_run_task(task):
+    """loads and runs a queued run/rep task. Used so tasks can be fed to a single pool with imap_unordered.
+    Returns a dict of the simulation, run and rep along with the summary data, the time taken and any error so the
+    caller can tell which task has just finished"""
+
+    sim, run_id, rep_id, seed, out_path = task
+
+    result = {'sim': sim,
+              'run': run_id,
+              'rep': rep_id,
+              'seed': seed,
+              'summaries': {},
+              'error': None}
+
+    task_start = time.perf_counter()
+
+    try:
+        run_input = load_run(sim, run_id, rep_id)
+        result['summaries'] = profiling.profile_call(profiling.task_profile_path(out_path, run_id, rep_id),
+                                                     start_run, run_input, seed, out_path)
+
+    except Exception:
+        result['error'] = traceback.format_exc()
+
+    result['duration'] = time.perf_counter() - task_start
+
+    return result
+
+
+def rep_seed(simulation, manifest, run, rep):
+    """returns the seed for the passed run/rep. Seeds given in the input file are used first, then any recorded in
+    the manifest of a batch being resumed, otherwise a new seed is created. Runs using common random numbers share
+    the seed of each rep and the even reps of antithetic pairs use the seed of the rep before. Seeds not given in the
+    input file are recorded so they can be saved with the config"""
+
+    input_seeds = simulation['input_data'][run]['replication seeds']
+    common, antithetic = rs.variance_reduction(simulation['input_data'][run])
+
+    if str(rep) in input_seeds:
+        return input_seeds[str(rep)]
+
+    if (run, rep) in manifest:
+        # reuse the seed recorded by the batch being resumed
+        seed = manifest[(run, rep)]['seed']
+
+    elif antithetic and rep % 2 == 0:
+        seed = rep_seed(simulation, manifest, run, rep - 1)
+
+    elif common and rep in simulation['common seeds']:
+        seed = simulation['common seeds'][rep]
+
+    else:
+        now = dt.datetime.now()
+        seed_date = dt.datetime(2012, 4, 12, 19, 00, 00)
+        seed = abs(now - seed_date).total_seconds() + rep
+        if not common:
+            seed += int(run)
+        #seed = 10  # uncomment to use same random seed for debug
+
+    if common:
+        simulation['common seeds'].setdefault(rep, seed)
+
+    if not str(run) in simulation['seeds']:
+        simulation['seeds'][str(run)] = {}
+    simulation['seeds'][str(run)][str(rep)] = seed
+
+    return seed
+
+
+def plan_reps(simulation, run, reps, manifest=None):
+    """returns a list of tasks for the passed reps of the passed run that are not already complete in the passed
+    manifest. New tasks are recorded in the manifest of the simulation straight away so their seeds are not lost if
+    the batch is stopped and any output left by tasks that were stopped part way through is removed"""
+
+    manifest = manifest or {}
+
+    tasks = []
+    planned = []
+    partial = []
+
+    for rep in reps:
+
+        seed = rep_seed(simulation, manifest, run, rep)
+
+        if (run, rep) in manifest:
+            if manifest[(run, rep)]['status'] == 'complete':
+                continue
+            partial.append(rep)
+        else:
+            planned.append((run, rep, seed, 'planned', 0, ''))
+
+        tasks.append((simulation['name'], run, rep, seed, simulation['output_path']))
+
+    if partial:
+        checkpoint.remove_partial_output(simulation['output_path'], run, partial)
+
+    if planned:
+        checkpoint.record_tasks(simulation['output_path'], planned)
+
+    return tasks
+
+
+def init_worker(heartbeats, profile, profile_memory):
+    """sets up the telemetry and profiling of a worker. Used as the initializer of the pool"""
+
+    telemetry.init_worker(heartbeats)
+    profiling.init_worker(profile)
+    memory_profiling.init_worker(profile_memory)
+
+
+def setup_simulation(sim, output_path, resume=False):
+    """loads the passed sim file, creates the output folder and returns a record of the simulation along with a list
+    of the run/rep tasks, with seeds, needed to complete it. If resume is True and an earlier batch of the sim was
+    stopped part way through, only the unfinished tasks of that batch are returned and its seeds reused. Runs with
+    adaptive replications start with their first wave of reps"""
+
+    sim_name = os.path.basename(sim)[:-5]  # get filename without the .JSON extension
+    sub_path_name = sim_name + " " + str(dt.datetime.now().strftime("%Y""-""%m""-""%d %H.%M.%S"))
+
+    resume_path = None
+    if resume:
+        resume_path = checkpoint.find_resumable(output_path, sim_name)
+
+    if resume_path:
+        # the saved config keeps the name of the batch being resumed
+        print('Resuming simulation from: ', resume_path)
+        sub_path_name = os.path.basename(resume_path)
+
+    current_output_path = os.path.join(output_path, sub_path_name)
+    output_JSON_name = sub_path_name + '.JSON'
+
+    if not os.path.isdir(current_output_path):
+        os.makedirs(current_output_path)
+
+    # tasks already planned or finished in the output folder - empty unless resuming
+    manifest = checkpoint.read_manifest(current_output_path)
+
+    with open(sim) as data_file:
+        input_data = json.load(data_file)
+
+    # get list of all districts in simulation
+    list_of_districts = sorted(list(input_data.keys()), key=int)
+
+    simulation = {'name': sim,
+                  'input_data': input_data,
+                  'seeds': defaultdict(),
+                  'costs': {},
+                  'adaptive': {},
+                  'households': {},
+                  'common seeds': {},
+                  'output_path': current_output_path,
+                  'output_JSON_name': output_JSON_name,
+                  'errors': []}
+
+    tasks = []
+    reps_per_run = {}
+
+    # runs using common random numbers share any seeds given for one of them in the input file
+    for district in list_of_districts:
+        if rs.variance_reduction(input_data[district])[0]:
+            for rep, seed in input_data[district]['replication seeds'].items():
+                simulation['common seeds'].setdefault(int(rep), seed)
+
+    # place, with random seeds, a reference to the run/rep into the task list
+    for district in list_of_districts:
+        simulation['costs'][district] = (scheduler.run_fingerprint(input_data[district]),
+                                         scheduler.estimate_cost(input_data[district]))
+
+        if 'adaptive replications' in input_data[district]:
+            adaptive_run = adaptive.AdaptiveRun(input_data[district]['adaptive replications'],
+                                                antithetic=rs.variance_reduction(input_data[district])[1])
+            simulation['adaptive'][district] = adaptive_run
+            simulation['households'][district] = adaptive.run_households(input_data[district])
+
+            # a resumed batch relaunches every rep it had got to
+            launched = [rep for run, rep in manifest if run == district]
+            if launched:
+                reps_per_run[district] = adaptive_run.next_reps(max(launched))
+            else:
+                reps_per_run[district] = adaptive_run.first_wave()
+
+        else:
+            reps_per_run[district] = list(range(1, input_data[district]['replications'] + 1))
+
+        tasks.extend(plan_reps(simulation, district, reps_per_run[district], manifest))
+
+    # summary data returned by each task is totalled as it arrives - when resuming add back the finished tasks. The
+    # number of reps of adaptive runs is not known up front so their rep totals are held until the end
+    summary = pp.SummaryTotals(os.path.join(current_output_path, 'summary'), reps_per_run,
+                               hold_reps=bool(simulation['adaptive']))
+    simulation['summary'] = summary
+
+    for (run, rep), rep_summaries in sorted(checkpoint.read_summaries(current_output_path, manifest).items()):
+        summary.add(run, rep, rep_summaries)
+
+        if run in simulation['adaptive']:
+            # finished reps of adaptive runs count towards the stopping rule
+            new_reps = simulation['adaptive'][run].add(rep, adaptive.rep_kpis(rep_summaries,
+                                                                              simulation['households'][run]))
+            tasks.extend(plan_reps(simulation, run, new_reps))
+
+    simulation['remaining'] = len(tasks)
+
+    return simulation, tasks
+
+
+def save_config(simulation, output_path):
+    """saves a gzipped copy of the input file for the passed simulation with the seeds used for each rep added"""
+
+    input_data = simulation['input_data']
+    dict_all = simulation['seeds']
+    json_file_path = os.path.join(output_path, simulation['output_JSON_name'])
+
+    list_of_seed_runs = sorted(list(dict_all.keys()), key=int)
+    # first assign the seeds...
+    for run in list_of_seed_runs:
+        input_data[run]['replication seeds'] = dict_all[run]
+
+    # ...then the number of reps actually used by runs with adaptive replications
+    for run, adaptive_run in simulation['adaptive'].items():
+        adaptive_summary = adaptive_run.summary()
+        input_data[run]['replications'] = adaptive_summary['reps']
+        input_data[run]['adaptive summary'] = adaptive_summary
+
+    with open(json_file_path, 'w') as outfile:
+        json.dump(input_data, outfile)
+
+    with open(json_file_path, 'rb') as f_in:
+        with gzip.open(json_file_path + '.gz', 'w') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+
+    # delete orig JSON file
+    os.remove(json_file_path)
+
+    """to read a gzip file
+    with gzip.open('file.txt.gz', 'rb') as f:
+        file_content = f.read()
+    """
+
+
+def finish_simulation(sim, simulation, output_path, working_path, profile=False, produce_default=True):
+    """writes out and post processes the passed simulation once all of its run/reps are done. Errors are logged
+    rather than raised so the rest of the batch carries on"""
+
+    try:
+
+        os.chdir(working_path)  # reset to overall working directory each time
+
+        # only the combined summary data is written out
+        simulation['summary'].write()
+
+        if simulation['errors']:
+            raise RuntimeError('run/reps failed: ' + str(simulation['errors']))
+
+        checkpoint.remove_summaries(simulation['output_path'])
+
+        if profile:
+            print("Merging profiles")
+            profiling.merge_profiles(simulation['output_path'])
+
+        # runs sharing random numbers are compared rep by rep
+        variance_reduction = [rs.variance_reduction(run_input)
+                              for run_input in simulation['input_data'].values()]
+        if any([common for common, antithetic in variance_reduction]):
+            print("Producing paired differences")
+            pp.paired_differences(os.path.join(simulation['output_path'], 'summary'),
+                                  antithetic=all([antithetic for common, antithetic in variance_reduction]))
+
+        for run, adaptive_run in simulation['adaptive'].items():
+            print('Run', run, 'of', sim, 'used', adaptive_run.reps_complete, 'reps')
+
+        if simulation['seeds'] or simulation['adaptive']:
+            print("Saving config file")
+            save_config(simulation, output_path)
+
+        print('Simulation complete at time: ', dt.datetime.now())
+
+        if not simulation['summary'].run_reps:
+            # as with no replications - there is nothing to post process
+            print('No run/reps were run for simulation: ', sim)
+
+        elif produce_default:
+            print("Starting post processing.")
+            produce_default_output(simulation['output_path'])
+
+    except Exception as e:
+
+        logging.error(traceback.format_exc())
+        print('Simulation error encountered in simulation: ', sim)
+
+
 if __name__ == '__main__':
 
-    create_new_config = False
     produce_default = True
     multiple_processors = True  # set to false to debug
     delete_old = False
+    resume = False  # set to true to carry on from the last unfinished batch of each sim rather than start again
+    max_attempts = 3  # times a run/rep that raises an error is tried before it is given up on
+    report_progress = True  # workers send heartbeats that are collected into outputs/progress.json
+    progress_interval = 30  # seconds between progress reports
+    profile = False  # profile each run/rep and merge the profiles into a report for each simulation
+    profile_memory = False  # report the memory used at each phase of each run/rep - slows the simulation down
     freeze_support()
 
     # delete all old output files but not the main directory.
@@ -321,139 +659,167 @@ if __name__ == '__main__':
 
     outputs = 'outputs'
     output_path = os.path.join(os.getcwd(), outputs)
+    if not os.path.isdir(output_path):
+        os.makedirs(output_path)
 
-    sims = len(simulation_list)
-    sim_counter = 1
-    # for each sim file in the input folder
-    for sim in simulation_list:
+    # measured run times from previous batches used to refine the estimated cost of each task
+    costs_path = os.path.join(output_path, 'task_costs.json')
+    costs = scheduler.load_costs(costs_path)
 
-        print("Simulation ", sim_counter, " of ", len(simulation_list),  " started.")
+    st = dt.datetime.now()
+    print('Simulation started at: ', st)
 
-        try:
+    # build a single task list of every run/rep in every sim file in the input folder
+    simulations = {}
+    task_list = []
+    for sim in simulation_list:
 
-            os.chdir(first_cwd)  # reset to overall working directory each time
-            sim_name = os.path.basename(sim)[:-5]  # get filename without the .JSON extension
-            sub_path_name = sim_name + " " + str(dt.datetime.now().strftime("%Y""-""%m""-""%d %H.%M.%S"))
-            output_JSON_name = sim_name + " " + str(dt.datetime.now().strftime("%Y""-""%m""-""%d %H.%M.%S")) + '.JSON'
-            current_output_path = os.path.join(output_path, sub_path_name)
-            if not os.path.isdir(current_output_path):
-                os.makedirs(current_output_path)
-
-            with open(sim) as data_file:
-                input_data = json.load(data_file)
-
-            # get list of all districts in simulation
-            list_of_districts = sorted(list(input_data.keys()), key=int)
-            districts = max([int(district) for district in list_of_districts])
-            reps = input_data['1']['replications']  # extract replications
-            max_runs = reps * districts
-
-            # define a list to be used to map all run/replication combinations to available processors
-            run_list = []
-            seed_dict = {}
-            seed_list = []
-            dict_all = defaultdict()
-
-            st = dt.datetime.now()
-            print('Simulation started at: ', st)
-            counter = 0
-
-            # place, with random seeds, a copy of the run/rep into the run list
-            for district in list_of_districts:
-                input_data[district]['run_id'] = district
-                seed_dict[str(district)] = {}
-                for rep in range(1, input_data[district]['replications'] + 1):
-
-                    if str(rep) not in input_data[district]['replication seeds']:
-                        now = dt.datetime.now()
-                        seed_date = dt.datetime(2012, 4, 12, 19, 00, 00)
-                        seed = abs(now - seed_date).total_seconds() + int(district) + rep
-                        #seed = 10  # uncomment to use same random seed for debug
-                        seed_dict[str(input_data[district]['run_id'])][str(rep)] = seed
-                        if not str(input_data[district]['run_id']) in dict_all:
-                            dict_all[str(input_data[district]['run_id'])] = {}
-                        dict_all[str(input_data[district]['run_id'])][str(rep)] = seed
-                        create_new_config = True
-
-                    else:
-                        seed = input_data[district]['replication seeds'][str(rep)]
-
-                    seed_list.append(seed)
-
-                    input_data[district]['rep_id'] = rep
-                    run_list.append(copy.deepcopy(input_data[district]))
-                    counter += 1
-
-                    # if run list len is chunk size run them...
-                    if len(run_list) == cpu_count()*4 or (district == str(districts) and rep == reps):
-
-                        # different run methods - use single processor for debugging
-                        if multiple_processors:
-                            pool = Pool(cpu_count())
-                            pool.starmap(start_run,
-                                         zip(run_list, seed_list, repeat(current_output_path)))
-                            pool.close()
-                            pool.join()
-                        else:
-                            for i in range(len(run_list)):
-                                start_run(run_list[i], seed_list[i], current_output_path)
-
-                        # calculate finish time for current simulation and print progress
-                        time_now = dt.datetime.now()
-                        time_left = ((time_now - st).seconds / (counter / max_runs)) - (time_now - st).seconds
-                        finish_time = time_now + dt.timedelta(seconds=time_left)
-
-                        print(pp.roundup((counter / max_runs) * 100, 1), "percent of current simulation complete. "
-                                                                         "Projected finish time is:", finish_time)
-                        run_list = []
-                        seed_dict[str(district)] = {}
-                        seed_list = []
-
-            # add back in the ability to output a record, with seeds, as to what has been run...
-            # dict all contains the required seeds
-
-            if create_new_config:
-                print("Saving config file")
-
-                json_file_path = os.path.join(output_path, output_JSON_name)
-
-                list_of_seed_runs = sorted(list(dict_all.keys()), key=int)
-                # first assign the seeds...
-                for run in list_of_seed_runs:
-                    input_data[run]['replication seeds'] = dict_all[run]
-                    # delete ids
-                    del input_data[run]['run_id']
-                    del input_data[run]['rep_id']
-
-                with open(json_file_path, 'w') as outfile:
-                    json.dump(input_data, outfile)
-
-                with open(json_file_path, 'rb') as f_in:
-                    with gzip.open(json_file_path + '.gz', 'w') as f_out:
-                        shutil.copyfileobj(f_in, f_out)
-
-                # delete orig JSON file
-                os.remove(json_file_path)
-
-                """to read a gzip file
-                with gzip.open('file.txt.gz', 'rb') as f:
-                    file_content = f.read()
-                """
-
-            print('Simulation complete at time: ', dt.datetime.now())
-
-            if produce_default:
-                print("Starting post processing.")
-                produce_default_output(current_output_path)
+        try:
+            simulations[sim], sim_tasks = setup_simulation(sim, output_path, resume)
+            task_list.extend(sim_tasks)
 
         except Exception as e:
 
             logging.error(traceback.format_exc())
             print('Simulation error encountered in simulation: ', sim)
 
-        cet = dt.datetime.now()
-        print(sim_counter, 'of', sims, 'complete at time', cet)
-        sim_counter += 1
+    # sims with nothing to run - no reps or a resumed batch that had already finished - are finished straight away
+    sim_counter = 1
+    for sim, simulation in simulations.items():
+        if simulation['remaining'] == 0:
+            finish_simulation(sim, simulation, output_path, first_cwd, profile, produce_default)
+
+            print(sim_counter, 'of', len(simulations), 'complete at time', dt.datetime.now())
+            sim_counter += 1
+
+    # dispatch the longest tasks first so large runs are not left to straggle at the end of the batch
+    task_list = scheduler.longest_first(task_list,
+                                        [scheduler.expected_duration(costs,
+                                                                     *simulations[task[0]]['costs'][task[1]])
+                                         for task in task_list])
+
+    # one long lived pool is fed every task so cores stay busy until the last task finishes - results are
+    # collected in the order they complete. Tasks are taken from a queue so retries and further waves of adaptive
+    # replications can be added while the pool is running. Use single processor for debugging
+    task_queue = queue.Queue()
+    for task in task_list:
+        task_queue.put(task)
+
+    heartbeats = None
+    monitor = None
+    if report_progress:
+        heartbeats = Queue(10000)
+        monitor = telemetry.ProgressMonitor(heartbeats, os.path.join(output_path, 'progress.json'), len(task_list),
+                                            progress_interval)
+        monitor.start()
+
+    if multiple_processors:
+        pool = Pool(cpu_count(), initializer=init_worker, initargs=(heartbeats, profile, profile_memory))
+        results = pool.imap_unordered(start_run_task, iter(task_queue.get, None))
+    else:
+        pool = None
+        init_worker(heartbeats, profile, profile_memory)
+        results = map(start_run_task, iter(task_queue.get, None))
+
+    max_runs = len(task_list)
+    outstanding = len(task_list)
+    counter = 0
+    attempts = defaultdict(int)
+
+    if outstanding == 0:
+        task_queue.put(None)
+
+    for result in results:
+
+        outstanding -= 1
+        sim = result['sim']
+        simulation = simulations[sim]
+        attempts[(sim, result['run'], result['rep'])] += 1
+        attempt = attempts[(sim, result['run'], result['rep'])]
+        new_tasks = []
+
+        if result['error']:
+            logging.error(result['error'])
+            checkpoint.record_task(simulation['output_path'], result['run'], result['rep'], result['seed'],
+                                   'failed', attempt, result['error'].strip().splitlines()[-1])
+
+            if attempt < max_attempts:
+                # tasks that fail are recorded against the task in the manifest and queued again once anything
+                # written by the failed attempt is removed
+                print('Run', result['run'], 'rep', result['rep'], 'of', sim, 'failed and will be retried')
+                with hp.l:
+                    checkpoint.remove_partial_output(simulation['output_path'], result['run'], [result['rep']])
+                task_queue.put((sim, result['run'], result['rep'], result['seed'], simulation['output_path']))
+                outstanding += 1
+                continue
+
+            simulation['errors'].append((result['run'], result['rep']))
+
+            if result['run'] in simulation['adaptive']:
+                new_reps = simulation['adaptive'][result['run']].add_failed()
+                new_tasks = plan_reps(simulation, result['run'], new_reps)
+
+        else:
+            # log the summary data before the task is marked as complete so it can be rebuilt on resume
+            checkpoint.record_summaries(simulation['output_path'], result['run'], result['rep'],
+                                        result['summaries'])
+            checkpoint.record_task(simulation['output_path'], result['run'], result['rep'], result['seed'],
+                                   'complete', attempt)
+            simulation['summary'].add(result['run'], result['rep'], result['summaries'])
+            scheduler.record_duration(costs, *simulation['costs'][result['run']], result['duration'])
+
+            if result['run'] in simulation['adaptive']:
+                # launch another wave of reps if the confidence intervals are still too wide
+                kpis = adaptive.rep_kpis(result['summaries'], simulation['households'][result['run']])
+                new_reps = simulation['adaptive'][result['run']].add(result['rep'], kpis)
+                new_tasks = plan_reps(simulation, result['run'], new_reps)
+
+        for task in new_tasks:
+            task_queue.put(task)
+
+        outstanding += len(new_tasks)
+        max_runs += len(new_tasks)
+        if monitor:
+            monitor.add_tasks(len(new_tasks))
+        simulation['remaining'] += len(new_tasks)
+
+        counter += 1
+        if monitor:
+            monitor.task_complete()
+        simulation['remaining'] -= 1
+
+        if outstanding == 0:
+            # nothing left to run so let the pool finish
+            task_queue.put(None)
+
+        # calculate finish time for the batch and print progress
+        time_now = dt.datetime.now()
+        time_taken = (time_now - st).total_seconds()
+        time_left = (time_taken / (counter / max_runs)) - time_taken
+        finish_time = time_now + dt.timedelta(seconds=time_left)
+
+        print(pp.roundup((counter / max_runs) * 100, 1), "percent of all simulations complete. "
+                                                         "Projected finish time is:", finish_time)
+
+        if simulation['remaining'] == 0:
+            # all reps for this sim file are done so save the seeds used and post process while the pool
+            # carries on
+            finish_simulation(sim, simulation, output_path, first_cwd, profile, produce_default)
+
+            cet = dt.datetime.now()
+            print(sim_counter, 'of', len(simulations), 'complete at time', cet)
+            sim_counter += 1
+
+    if pool:
+        pool.close()
+        pool.join()
+
+    if monitor:
+        monitor.stop()
+
+    scheduler.save_costs(costs_path, costs)
+
+    os.chdir(first_cwd)
 
     # overall end time
     et = dt.datetime.now()
@@ -0,0 +1,217 @@
+"""module used to decide how many replications of a run are needed. Rather than use a fixed number of reps, reps
+are launched in waves and a run stops once the confidence intervals of the chosen key performance indicators (KPI)
+are narrow enough or a cap on the number of reps is reached.
+
+Set by adding an entry of the following format to a run in the input JSON:
+
+    "adaptive replications": {"min_reps": 5,
+                              "wave": 2,
+                              "max_reps": 50,
+                              "confidence": 95,
+                              "tolerance": {"response_rate": 0.5, "visits": 100, "co_time": 50}}
+
+where tolerance is the largest acceptable half width of the confidence interval for each KPI to track. The KPI
+available are the final response rate, as a percentage of households, the total number of visits and the total time
+spent by census officers. Each needs the matching summary to be recorded in output options. Runs with antithetic reps
+launch them in pairs, rounding min_reps, wave and max_reps up to even numbers."""
+
+import math
+from statistics import NormalDist
+
+# summary data each KPI is calculated from
+kpi_sources = {'response_rate': 'active_totals',
+               'visits': 'visit_totals',
+               'co_time': 'time_totals'}
+
+
+def run_households(run_input):
+    """returns the total number of households in the passed run"""
+
+    return sum([hh_value['number'] for district in run_input['districts'].values()
+                for hh_value in district['households'].values()])
+
+
+def rep_kpis(summaries, households):
+    """returns a dict of the KPI of a single rep calculated from the summary arrays it returned"""
+
+    kpis = {}
+
+    for kpi, source in kpi_sources.items():
+        if source in summaries:
+            codes, values = summaries[source]['la']
+            kpis[kpi] = float(values.sum())
+
+    if 'response_rate' in kpis:
+        kpis['response_rate'] = kpis['response_rate'] / max(households, 1) * 100
+
+    return kpis
+
+
+def t_cdf(t, df):
+    """returns the cdf of Student's t distribution with a whole number of degrees of freedom at t. Uses the closed form
+    of the distribution (Abramowitz and Stegun 26.7.3 and 26.7.4)"""
+
+    theta = math.atan(abs(t) / math.sqrt(df))
+    cos2 = math.cos(theta) ** 2
+
+    if df % 2:
+        term = math.cos(theta)
+        total = term if df > 1 else 0
+        for j in range(3, df - 1, 2):
+            term *= cos2 * (j - 1) / j
+            total += term
+        within = 2 / math.pi * (theta + math.sin(theta) * total)
+    else:
+        term = 1.0
+        total = 1.0
+        for j in range(2, df - 1, 2):
+            term *= cos2 * (j - 1) / j
+            total += term
+        within = math.sin(theta) * total
+
+    return 0.5 + math.copysign(within / 2, t)
+
+
+def t_quantile(p, df):
+    """returns the p quantile of Student's t distribution with df degrees of freedom. Uses the Cornish-Fisher
+    expansion of the normal quantile so no extra packages are needed. As the expansion is poor for few degrees of
+    freedom, up to 5 the exact cdf is inverted by bisection instead"""
+
+    z = NormalDist().inv_cdf(p)
+
+    if df <= 5:
+        # the quantile lies between the normal quantile and the cauchy quantile
+        low, high = sorted([z, math.tan(math.pi * (p - 0.5))])
+        for i in range(100):
+            mid = (low + high) / 2
+            if t_cdf(mid, df) < p:
+                low = mid
+            else:
+                high = mid
+        return (low + high) / 2
+
+    return (z + (z**3 + z) / (4 * df) + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * df**2) +
+            (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / (384 * df**3))
+
+
+def half_width(values, confidence):
+    """returns the half width of the confidence interval of the mean of the passed values"""
+
+    n = len(values)
+    if n < 2:
+        return math.inf
+
+    mean = sum(values) / n
+    variance = sum([(value - mean) ** 2 for value in values]) / (n - 1)
+
+    return t_quantile(0.5 + confidence / 200, n - 1) * math.sqrt(variance / n)
+
+
+def round_to_pairs(reps):
+    # returns the passed number of reps rounded up to a whole number of antithetic pairs
+
+    return reps + reps % 2
+
+
+class AdaptiveRun(object):
+    """tracks the KPI of each completed rep of a run and decides when enough reps have been run. If the run uses
+    antithetic reps they are launched in whole pairs and, as the reps of a pair are not independent, the confidence
+    intervals are found from the mean of each complete pair"""
+
+    def __init__(self, input_data, antithetic=False):
+
+        self.antithetic = antithetic
+        self.min_reps = max(int(input_data['min_reps']), 2)
+        self.wave = max(int(input_data['wave']), 1)
+        self.max_reps = max(int(input_data['max_reps']), self.min_reps)
+
+        if antithetic:
+            self.min_reps = round_to_pairs(self.min_reps)
+            self.wave = round_to_pairs(self.wave)
+            self.max_reps = round_to_pairs(self.max_reps)
+
+        self.confidence = input_data['confidence']
+        self.tolerance = input_data['tolerance']
+
+        for kpi in self.tolerance:
+            if kpi not in kpi_sources:
+                raise ValueError('unknown KPI for adaptive replications: ' + str(kpi))
+
+        self.kpis = {kpi: {} for kpi in self.tolerance}  # value of each KPI for each completed rep
+        self.reps_launched = 0
+        self.reps_outstanding = 0
+        self.reps_complete = 0
+
+    def next_reps(self, reps):
+        """returns a list of the next reps to launch and records them as outstanding"""
+
+        if self.antithetic:
+            reps = round_to_pairs(reps)
+
+        first_rep = self.reps_launched + 1
+        self.reps_launched = min(self.reps_launched + reps, self.max_reps)
+        self.reps_outstanding += self.reps_launched - first_rep + 1
+
+        return list(range(first_rep, self.reps_launched + 1))
+
+    def first_wave(self):
+        """returns the reps to launch first"""
+
+        return self.next_reps(self.min_reps)
+
+    def add(self, rep, kpis):
+        """adds the KPI of the passed completed rep. Returns the next wave of reps to launch if the current wave is
+        finished and the confidence intervals are not yet narrow enough, otherwise an empty list"""
+
+        for kpi in self.kpis:
+            if kpi not in kpis:
+                raise KeyError('summary data needed for KPI ' + kpi + ' is not recorded - check output options')
+            self.kpis[kpi][rep] = kpis[kpi]
+
+        self.reps_complete += 1
+
+        return self.finish_rep()
+
+    def add_failed(self):
+        """records a rep that failed and will not be retried. Returns the next wave of reps as add does"""
+
+        return self.finish_rep()
+
+    def finish_rep(self):
+        """marks an outstanding rep as finished and returns the next wave of reps if one is needed"""
+
+        self.reps_outstanding -= 1
+
+        if self.reps_outstanding > 0 or self.converged() or self.reps_launched >= self.max_reps:
+            return []
+
+        return self.next_reps(self.wave)
+
+    def values(self, kpi):
+        """returns the independent values of the passed KPI - the value of each completed rep or, if antithetic, the
+        mean of each pair of reps that both completed"""
+
+        rep_values = self.kpis[kpi]
+
+        if not self.antithetic:
+            return [rep_values[rep] for rep in sorted(rep_values)]
+
+        return [(rep_values[rep] + rep_values[rep + 1]) / 2 for rep in sorted(rep_values)
+                if rep % 2 == 1 and rep + 1 in rep_values]
+
+    def converged(self):
+        """returns True if the confidence interval of every tracked KPI is within tolerance"""
+
+        return all([half_width(self.values(kpi), self.confidence) <= self.tolerance[kpi] for kpi in self.kpis])
+
+    def summary(self):
+        """returns a dict of the reps used and the mean and half width of each KPI"""
+
+        summary = {'reps': self.reps_complete}
+
+        for kpi in self.kpis:
+            values = self.values(kpi)
+            summary[kpi + '_mean'] = sum(values) / len(values) if values else math.nan
+            summary[kpi + '_half_width'] = half_width(values, self.confidence)
+
+        return summary
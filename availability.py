@@ -0,0 +1,66 @@
+"""module used to compile the weekly availability schedules of advisers and census officers. A schedule is given in
+the input as a list of "HH:MM" start and end times for each day of the week, keyed "0" (Monday) to "6". Each distinct
+schedule is compiled once, into the start and end of each shift in decimal hours, and the compiled calendar is shared
+by every adviser or census officer with that schedule"""
+
+import datetime as dt
+import helper as h
+
+calendars = {}  # compiled calendar of each schedule seen by the process
+
+
+def calendar(schedule):
+    """returns the compiled calendar of the passed availability schedule"""
+
+    key = tuple(sorted((day, tuple(times)) for day, times in schedule.items()))
+
+    if key not in calendars:
+        calendars[key] = WeeklyCalendar(schedule)
+
+    return calendars[key]
+
+
+def time_decimal(str_time):
+    # converts a "HH:MM" time to decimal hours
+
+    return h.make_time_decimal(dt.time(*map(int, str_time.split(':'))))
+
+
+class WeeklyCalendar(object):
+    """the shifts of an availability schedule for each day of the week, in decimal hours"""
+
+    def __init__(self, schedule):
+
+        self.starts = []  # start of each shift on each day of the week
+        self.ends = []  # end of each shift on each day of the week
+
+        for day in range(7):
+            times = [time_decimal(str_time) for str_time in schedule.get(str(day), [])]
+            self.starts.append(times[0::2])
+            self.ends.append(times[1::2])
+
+    def shifts(self, day):
+        """returns a list of the start and end of each shift on the passed day of the week"""
+
+        return list(zip(self.starts[day], self.ends[day]))
+
+    def on_shift(self, day, time_of_day):
+        """returns true if the passed time of day, in hours, is within a shift on the passed day of the week"""
+
+        for start, end in zip(self.starts[day], self.ends[day]):
+            if start <= time_of_day < end:
+                return True
+
+        return False
+
+    def next_working_day(self, day, time_of_day, start_day):
+        """returns the day of the week, and the number of days after the passed day of the sim, of the next day with a
+        shift that ends after the passed time of day. Only the passed day is tested against the time of day. The day
+        of the week of the start of the sim is passed"""
+
+        for count in range(8):
+            dow = (start_day + day + count) % 7
+            if self.ends[dow] and self.ends[dow][-1] > (time_of_day if count == 0 else 0):
+                return dow, count
+
+        raise ValueError("availability schedule has no shifts")
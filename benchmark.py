@@ -0,0 +1,295 @@
+"""module used to benchmark the simulation engine. Synthetic runs of increasing size are built from a template and
+each is run end to end with start_run in a fresh process. The wall time, simpy events per second, households created
+per second, peak memory and bytes of output are recorded for each and compared with a saved baseline so regressions
+between versions can be seen"""
+
+import copy
+import csv
+import datetime as dt
+import glob
+import json
+import math
+import multiprocessing
+import os
+import queue
+import random
+import shutil
+import tempfile
+import time
+
+import district
+import FOS_main
+import telemetry
+
+try:
+    import resource
+except ImportError:
+    # not available on windows
+    resource = None
+
+
+# districts, households per district, census officers per district, advisers and letter phases of each scenario
+default_scenarios = [(1, 1000, 2, 10, 3),
+                     (2, 5000, 10, 20, 3),
+                     (5, 20000, 40, 50, 3),
+                     (10, 100000, 200, 200, 3)]
+
+result_fields = ['scenario', 'districts', 'households', 'census_officers', 'advisers', 'letter_phases', 'wall_time',
+                 'events', 'events_per_sec', 'create_households_time', 'households_per_sec', 'peak_rss_mb',
+                 'output_bytes']
+
+
+def scenario_name(districts, households, census_officers, advisers, letter_phases):
+    return 'd{}_hh{}_co{}_ad{}_lp{}'.format(districts, households, census_officers, advisers, letter_phases)
+
+
+def share(total, parts):
+    """returns a list of the passed total split as evenly as possible into the passed number of whole parts"""
+
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+def make_scenario(template_path, districts, households, census_officers, advisers, letter_phases,
+                  households_per_lsoa=500):
+    """returns a run built from the first run and district of the passed template. The run has the passed number of
+    districts, each with its own la, the passed number of households split across the hh types of the template and
+    spread over lsoa of the passed size, the passed number of census officers and the first of the letter phases of
+    the template. The passed number of advisers is split across the adviser types, each available from the start to
+    the end of the run. Raises a ValueError if more letter phases are passed than the template has"""
+
+    with open(template_path) as data_file:
+        template = json.load(data_file)
+
+    run = copy.deepcopy(template[sorted(template.keys(), key=int)[0]])
+    district_template = run['districts'][sorted(run['districts'].keys())[0]]
+    run['districts'] = {}
+    run['replications'] = 1
+    run['replication seeds'] = {}
+
+    hh_types = sorted(district_template['households'].keys(), key=int)
+    co_types = sorted(district_template['census officer'].keys())
+    adviser_types = sorted(run['advisers'].keys())
+
+    if letter_phases > len(district_template['letter_phases']):
+        raise ValueError("template has only " + str(len(district_template['letter_phases'])) + " letter phases")
+
+    for adviser_type, number in zip(adviser_types, share(advisers, len(adviser_types))):
+        run['advisers'][adviser_type]['number'] = number
+        # advisers work for the whole run whatever the dates of the template
+        run['advisers'][adviser_type]['start_date'] = run['start_date']
+        run['advisers'][adviser_type]['end_date'] = run['end_date']
+
+    for district_id in range(1, districts + 1):
+        new_district = copy.deepcopy(district_template)
+        la = 'LA' + str(district_id)
+        lsoas = [la + '_L' + str(i) for i in range(1, max(1, math.ceil(households / households_per_lsoa)) + 1)]
+
+        for hh_type, number in zip(hh_types, share(households, len(hh_types))):
+            hh_value = new_district['households'][hh_type]
+            hh_value['number'] = number
+            hh_value['cca_makeup'] = {la: dict(zip(lsoas, share(number, len(lsoas))))}
+
+        for co_type, number in zip(co_types, share(census_officers, len(co_types))):
+            new_district['census officer'][co_type]['number'] = number
+
+        new_district['letter_phases'] = dict(list(district_template['letter_phases'].items())[:letter_phases])
+
+        run['districts'][str(district_id)] = new_district
+
+    return run
+
+
+def write_raw_inputs(folder, run, seed=1):
+    """writes synthetic response and call profiles, covering the passed run, to a raw_inputs folder in the passed
+    folder. Used when the real profiles are not available"""
+
+    start_date = dt.date(*map(int, run['start_date'].split(',')))
+    end_date = dt.date(*map(int, run['end_date'].split(',')))
+    days = (end_date - start_date).days - 5
+    hh_types = sorted(list(run['districts'].values())[0]['households'].keys(), key=int)
+    rnd = random.Random(seed)
+
+    raw_path = os.path.join(folder, 'raw_inputs')
+    if not os.path.isdir(raw_path):
+        os.makedirs(raw_path)
+
+    with open(os.path.join(raw_path, 'summary_returns_2017.csv'), 'w', newline='') as f_output:
+        csv_output = csv.writer(f_output)
+        csv_output.writerow(['Date', 'Day'] + hh_types)
+        for day in range(days):
+            csv_output.writerow([str(start_date + dt.timedelta(days=day)), day] +
+                                [float(rnd.randint(1, 100)) for hh_type in hh_types])
+
+    with open(os.path.join(raw_path, 'call profile.csv'), 'w', newline='') as f_output:
+        csv_output = csv.writer(f_output)
+        csv_output.writerow(['Day', 'Total Contacts'])
+        for day in range(days):
+            csv_output.writerow([day, float(rnd.randint(1, 100))])
+
+    with open(os.path.join(raw_path, 'call_times_in_day.csv'), 'w', newline='') as f_output:
+        csv_output = csv.writer(f_output)
+        csv_output.writerow(['Weekday', 'Saturday', 'Sunday', 'Census Day'])
+        for half_hour in range(48):
+            # calls only between 8am and 9pm
+            value = float(rnd.randint(1, 100)) if 16 <= half_hour <= 42 else 0.0
+            csv_output.writerow([value] * 4)
+
+
+def folder_size(folder):
+    """returns the total bytes of the files in the passed folder"""
+
+    return sum([os.path.getsize(file) for file in glob.glob(os.path.join(folder, '**', '*'), recursive=True)
+                if os.path.isfile(file)])
+
+
+def measure(run, seed, out_path):
+    """runs a single rep of the passed run with start_run and returns a dict of measurements. Intended to be run in a
+    fresh process so the peak memory is that of the rep alone"""
+
+    # time spent creating households is measured by wrapping the district method
+    household_times = []
+    create_households = district.District.create_households
+
+    def timed_create_households(self):
+        start = time.perf_counter()
+        create_households(self)
+        household_times.append(time.perf_counter() - start)
+
+    district.District.create_households = timed_create_households
+
+    # simpy events are counted by the telemetry loop and reported in its final heartbeat
+    heartbeats = queue.Queue()
+    telemetry.init_worker(heartbeats)
+
+    run_input = copy.deepcopy(run)
+    run_input['run_id'] = '1'
+    run_input['rep_id'] = 1
+
+    start = time.perf_counter()
+    try:
+        FOS_main.start_run(run_input, seed, out_path)
+    finally:
+        district.District.create_households = create_households
+    wall_time = time.perf_counter() - start
+
+    events = 0
+    while not heartbeats.empty():
+        events = heartbeats.get()['events']
+
+    households = sum([hh_value['number'] for district_value in run['districts'].values()
+                      for hh_value in district_value['households'].values()])
+
+    return {'wall_time': wall_time,
+            'events': events,
+            'events_per_sec': events / wall_time if wall_time > 0 else 0,
+            'create_households_time': sum(household_times),
+            'households_per_sec': households / sum(household_times) if sum(household_times) > 0 else 0,
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else None,
+            'output_bytes': folder_size(out_path)}
+
+
+def run_benchmark(template_path, scenarios, results_path, seed=1):
+    """runs each of the passed scenarios in a fresh process and writes the measurements to the passed csv file.
+    Returns a list of the results"""
+
+    results = []
+    context = multiprocessing.get_context('spawn')
+
+    for districts, households, census_officers, advisers, letter_phases in scenarios:
+
+        name = scenario_name(districts, households, census_officers, advisers, letter_phases)
+        print('Running benchmark scenario', name)
+
+        run = make_scenario(template_path, districts, households, census_officers, advisers, letter_phases)
+        out_path = tempfile.mkdtemp(prefix='benchmark ')
+
+        try:
+            with context.Pool(1) as pool:
+                result = pool.apply(measure, (run, seed, out_path))
+        finally:
+            shutil.rmtree(out_path, ignore_errors=True)
+
+        result.update({'scenario': name,
+                       'districts': districts,
+                       'households': districts * households,
+                       'census_officers': districts * census_officers,
+                       'advisers': advisers,
+                       'letter_phases': letter_phases})
+        results.append(result)
+
+        print(name, 'took', round(result['wall_time'], 2), 'seconds at', int(result['events_per_sec']),
+              'events/sec')
+
+    with open(results_path, 'w', newline='') as f_output:
+        csv_output = csv.DictWriter(f_output, fieldnames=result_fields)
+        csv_output.writeheader()
+        csv_output.writerows(results)
+
+    return results
+
+
+def compare_with_baseline(results, baseline_path, tolerance=0.1):
+    """prints the change in wall time and events per second of each scenario from the saved baseline, flagging any
+    that are slower by more than the passed tolerance. Returns a list of the scenarios that have regressed"""
+
+    if not os.path.isfile(baseline_path):
+        print('No baseline found at', baseline_path)
+        return []
+
+    with open(baseline_path) as data_file:
+        baseline = {result['scenario']: result for result in json.load(data_file)}
+
+    regressions = []
+    for result in results:
+        if result['scenario'] not in baseline:
+            continue
+
+        base = baseline[result['scenario']]
+        time_ratio = result['wall_time'] / base['wall_time'] if base['wall_time'] > 0 else math.inf
+        rate_ratio = result['events_per_sec'] / base['events_per_sec'] if base['events_per_sec'] > 0 else math.inf
+
+        flag = ''
+        if time_ratio > 1 + tolerance:
+            flag = 'REGRESSION'
+            regressions.append(result['scenario'])
+
+        print('{:<40} wall time x{:.2f}  events/sec x{:.2f}  {}'.format(result['scenario'], time_ratio, rate_ratio,
+                                                                         flag))
+
+    return regressions
+
+
+def save_baseline(results, baseline_path):
+
+    with open(baseline_path, 'w') as outfile:
+        json.dump(results, outfile, indent=1)
+
+
+if __name__ == '__main__':
+
+    scenarios = default_scenarios
+    template_path = os.path.join(os.getcwd(), 'templates', '2017 C2EO331 and C2SO331.JSON')
+    output_path = os.path.join(os.getcwd(), 'outputs', 'benchmarks')
+    baseline_path = os.path.join(output_path, 'baseline.json')
+    update_baseline = False  # set to true to make this the baseline later versions are compared against
+    multiprocessing.freeze_support()
+
+    if not os.path.isdir(output_path):
+        os.makedirs(output_path)
+
+    # synthetic profiles are used if the real ones are not available
+    first_cwd = os.getcwd()
+    if not os.path.isdir(os.path.join(first_cwd, 'raw_inputs')):
+        work_path = tempfile.mkdtemp(prefix='benchmark inputs ')
+        write_raw_inputs(work_path, make_scenario(template_path, *scenarios[0]))
+        os.chdir(work_path)
+
+    results_path = os.path.join(output_path, 'benchmark ' + dt.datetime.now().strftime("%Y-%m-%d %H.%M.%S") + '.csv')
+    benchmark_results = run_benchmark(template_path, scenarios, results_path)
+
+    os.chdir(first_cwd)
+
+    compare_with_baseline(benchmark_results, baseline_path)
+
+    if update_baseline or not os.path.isfile(baseline_path):
+        save_baseline(benchmark_results, baseline_path)
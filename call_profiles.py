@@ -4,13 +4,21 @@ profiles to be sampled"""
 import numpy as np
 import pandas as pd
 import os
+import profile_cache
 
 
 def call_profiles_2011_all():
     # generates a profile to use for calls to the help line based on 2011 data
 
-    fields = ['Total Contacts']
     input_path = os.path.join(os.getcwd(), 'raw_inputs', 'call profile.csv')
+
+    return profile_cache.cached_profile(input_path, read_call_profiles)
+
+
+def read_call_profiles(input_path):
+    # reads and builds the profile returned by call_profiles_2011_all
+
+    fields = ['Total Contacts']
     calls = pd.read_csv(input_path, skipinitialspace=True, usecols=fields)
     # convert to a probability distribution
     prob_calls = calls.divide(calls.sum(axis=0), axis=1)    # ans now create cumulative probability
@@ -22,8 +30,15 @@ def call_profiles_2011_all():
 
 def call_profiles_day_2011():
 
-    fields = ['Weekday', 'Saturday', 'Sunday', 'Census Day']
     input_path = os.path.join(os.getcwd(), 'raw_inputs', 'call_times_in_day.csv')
+
+    return profile_cache.cached_profile(input_path, read_call_profiles_day)
+
+
+def read_call_profiles_day(input_path):
+    # reads and builds the profile returned by call_profiles_day_2011
+
+    fields = ['Weekday', 'Saturday', 'Sunday', 'Census Day']
     call_day = pd.read_csv(input_path, skipinitialspace=True, usecols=fields)
     # make all headers lowercase as they are used as keys
     call_day.columns = map(str.lower, call_day.columns)
@@ -34,27 +49,24 @@ def call_profiles_day_2011():
     # return a dataframe of the cumulative probability of response
     return cum_prob_call_day
 
-def sample_calls_2011_all(rep):
-    # returns the position in a matrix where an argument is found
-    # in this case the position of the first true element
-
-    rt = rep.call_df.as_matrix()
-    r = rep.rnd.uniform(0, 1)
-    return np.argwhere(rt == min(rt[(rt - r) > 0]))[0][0] + 1
-
-
-def sample_calls_day_2011(rep, day_type):
-    # samples call profile. As will always find lower bound add between 0 and 0.5 to get time
-    # assumes calls relieved uniformly over each 30 minute period
-
-    rt = rep.call_day_df[day_type].as_matrix()
-    r = rep.rnd.uniform(0, 1)
-    time = (np.argwhere(rt == min(rt[(rt - r) > 0]))[0][0])/2 + rep.rnd.uniform(0, 0.5)
-    return time
 
+def sample_calls_all(rep, rnd, size):
+    """returns an array of the passed number of call days - the position of the first value of the profile greater
+    than each draw of the passed batch generator"""
 
+    return rep.call_samplers['Total Contacts'].sample_batch(rnd, size) + 1
 
 
+def sample_calls_day_all(rep, day_types, rnd):
+    """returns an array of call times, one for each of the passed day types, drawn with the passed batch generator. As
+    the profile gives the half hour of a call, between 0 and 0.5 is added as calls are assumed uniform over each half
+    hour"""
 
+    r = rnd.random(len(day_types))
+    index = np.zeros(len(day_types))
 
+    for day_type in np.unique(day_types):
+        on_day = day_types == day_type
+        index[on_day] = rep.call_day_samplers[day_type].sample_values(r[on_day])
 
+    return index/2 + rnd.uniform(0, 0.5, len(day_types))
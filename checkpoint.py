@@ -0,0 +1,144 @@
+"""module used to keep a durable record, or manifest, of the run/rep tasks in a simulation so that a batch that is
+stopped part way through can be resumed without repeating finished work"""
+
+import csv
+import datetime as dt
+import glob
+import json
+import os
+import pickle
+
+manifest_name = 'manifest.csv'
+manifest_fields = ['run', 'rep', 'seed', 'status', 'attempt', 'time', 'error']
+summary_log_name = 'summary_log.pkl'
+
+
+def record_tasks(out_path, entries):
+    """appends the status of each task in the passed list of (run, rep, seed, status, attempt, error) entries to the
+    manifest in the passed output folder. Status is one of planned, complete or failed. The file is flushed to disk
+    straight away so the record survives a crash"""
+
+    manifest_path = os.path.join(out_path, manifest_name)
+    new_file = not os.path.isfile(manifest_path)
+    time_now = dt.datetime.now()
+
+    with open(manifest_path, 'a', newline='') as f_output:
+        csv_output = csv.writer(f_output)
+        if new_file:
+            csv_output.writerow(manifest_fields)
+        csv_output.writerows([list(entry[:5]) + [time_now] + list(entry[5:]) for entry in entries])
+        f_output.flush()
+        os.fsync(f_output.fileno())
+
+
+def record_task(out_path, run, rep, seed, status, attempt=0, error=''):
+    """appends the status of a single task to the manifest in the passed output folder"""
+
+    record_tasks(out_path, [(run, rep, seed, status, attempt, error)])
+
+
+def read_manifest(out_path):
+    """returns a dict, keyed by (run, rep), of the seed, latest status and number of failed attempts of each task in
+    the manifest in the passed output folder"""
+
+    tasks = {}
+    manifest_path = os.path.join(out_path, manifest_name)
+
+    if not os.path.isfile(manifest_path):
+        return tasks
+
+    with open(manifest_path, 'r', newline='') as f_input:
+        for row in csv.DictReader(f_input):
+            key = (row['run'], int(row['rep']))
+            if key not in tasks:
+                tasks[key] = {'seed': json.loads(row['seed']), 'status': row['status'], 'failed': 0}
+            tasks[key]['status'] = row['status']
+            if row['status'] == 'failed':
+                tasks[key]['failed'] += 1
+
+    return tasks
+
+
+def incomplete_tasks(tasks):
+    """returns a list of the (run, rep) keys in the passed manifest that have not completed"""
+
+    return [key for key, value in tasks.items() if value['status'] != 'complete']
+
+
+def find_resumable(output_path, sim_name):
+    """returns the most recent output folder for the passed sim that has a manifest with unfinished tasks or None if
+    there isn't one"""
+
+    folders = sorted(glob.glob(os.path.join(output_path, sim_name + ' *' + os.path.sep)), reverse=True)
+
+    for folder in folders:
+        tasks = read_manifest(folder)
+        if tasks and incomplete_tasks(tasks):
+            return os.path.normpath(folder)
+
+    return None
+
+
+def remove_partial_output(out_path, run, reps):
+    """removes any rows written by the passed reps of the passed run from the raw output files so a rep that was
+    stopped part way through can be run again without its output being duplicated"""
+
+    reps = [str(rep) for rep in reps]
+
+    for file_path in glob.glob(os.path.join(out_path, '*', str(run) + '.csv')):
+
+        with open(file_path, 'r', newline='') as f_input:
+            rows = list(csv.reader(f_input))
+
+        if not rows or 'rep' not in rows[0]:
+            continue
+
+        rep_col = rows[0].index('rep')
+        kept_rows = [rows[0]] + [row for row in rows[1:] if row[rep_col] not in reps]
+
+        if len(kept_rows) < len(rows):
+            with open(file_path, 'w', newline='') as f_output:
+                csv.writer(f_output).writerows(kept_rows)
+
+
+def record_summaries(out_path, run, rep, summaries):
+    """appends the summary arrays returned by a run/rep to a log in the passed output folder so the running totals
+    of the summary data can be rebuilt if the batch is resumed"""
+
+    with open(os.path.join(out_path, summary_log_name), 'ab') as f_output:
+        pickle.dump((run, rep, summaries), f_output)
+        f_output.flush()
+        os.fsync(f_output.fileno())
+
+
+def read_summaries(out_path, tasks):
+    """returns a dict, keyed by (run, rep), of the logged summary arrays of each task that is complete in the passed
+    manifest"""
+
+    summaries = {}
+    log_path = os.path.join(out_path, summary_log_name)
+
+    if not os.path.isfile(log_path):
+        return summaries
+
+    with open(log_path, 'rb') as f_input:
+        while True:
+            try:
+                run, rep, rep_summaries = pickle.load(f_input)
+            except (EOFError, pickle.UnpicklingError):
+                # end of the log or a record cut short by the batch being stopped
+                break
+
+            if (run, rep) in tasks and tasks[(run, rep)]['status'] == 'complete':
+                summaries[(run, rep)] = rep_summaries
+
+    return summaries
+
+
+def remove_summaries(out_path):
+    """deletes the summary log once the summary data has been written out"""
+
+    log_path = os.path.join(out_path, summary_log_name)
+
+    if os.path.isfile(log_path):
+        os.remove(log_path)
@@ -4,10 +4,12 @@ import household
 import sys
 import hq
 import math
+import numpy as np
 from simpy.util import start_delayed
 import output_options as oo
 import helper as h
 import FFU
+import random_streams as rs
 
 
 class District(object):
@@ -18,10 +20,13 @@ class District(object):
         self.district = name
 
         # created by and belong too the class
-        self.rnd = self.rep.rnd
+        self.rnd = self.rep.streams.household
         self.env = self.rep.env
         self.input_data = self.rep.input_data['districts'][name]
         self.households = []  # list of household objects in the district
+        # state of the households in the district - sized for every household though early responders are not added
+        self.hh_table = household.HouseholdTable(self.rep, self, sum([int(hh_input_data['number']) for hh_input_data
+                                                                      in self.input_data['households'].values()]))
         self.district_co = []  # list of CO assigned to the district
         self.letters = []  # list of letters to be sent to hh in the district
         self.total_households = 0  # count of total including those not represented by objects
@@ -53,10 +58,16 @@ class District(object):
         else:
             self.first_interaction = 0
 
+        # numpy generators the random numbers of households are drawn from in batches
+        self.hh_rnd = rs.batch_generator(self.rnd)
+        self.response_rnd = rs.batch_generator(self.rep.streams.response)
+        self.call_rnd = rs.batch_generator(self.rep.streams.call)
+
         # create households that exist in the district
         self.create_households()
         # randomise list -  so ignore priority
         self.rnd.shuffle(self.households)
+        self.hh_table.set_order(self.households)
         try:
             self.hh_area = self.input_data['district_area'] / len(self.households)
             self.initial_hh_sep = 2 * (math.sqrt(self.hh_area / math.pi))
@@ -80,23 +91,22 @@ class District(object):
 
     def non_response(self):
 
-        for household in self.households:
-            if not household.return_sent:
-                if oo.record_non_response:
-                    self.rep.output_data['Non_response'].append(oo.generic_output(self.rep.reps,
-                                                                                  self.district,
-                                                                                  household.la,
-                                                                                  household.lsoa,
-                                                                                  household.digital,
-                                                                                  household.hh_type,
-                                                                                  household.hh_id,
-                                                                                  self.env.now))
+        for household in self.hh_table.not_returned():
+            if oo.record_non_response:
+                self.rep.output_data['Non_response'].append(oo.generic_output(self.rep.reps,
+                                                                              self.district,
+                                                                              household.la,
+                                                                              household.lsoa,
+                                                                              household.digital,
+                                                                              household.hh_type,
+                                                                              household.hh_id,
+                                                                              self.env.now))
         yield self.env.timeout(0)
 
     def start_hh(self):
         # all start at the same time at present - in reality not all will receive IAC at same time
         for household in self.households:
-            self.env.process(household.action())
+            household.activate()
 
         yield self.env.timeout((self.rep.sim_hours) - self.env.now)
 
@@ -146,14 +156,14 @@ class District(object):
                 print("Error when creating CO type", co_type, " in run: ", self.rep.run)
                 sys.exit()
 
-    def return_household_geog(self, input_dict, hh_type, hh_digital):
-        # returns LA and LSOA codes for current hh
+    def allocate_geography(self, input_dict, number):
+        """returns a list of the LA and LSOA codes of each of the passed number of hh. Households are allocated to each
+        LSOA of the passed cca makeup in turn, up to its count. The input is left unchanged so can be reused"""
 
-        for la in input_dict:
-            for lsoa in input_dict[la]:
-                if int(input_dict[la][lsoa]) > 0:
-                    input_dict[la][lsoa] = int(input_dict[la][lsoa]) - 1
-                    return oo.hh_geography(la, lsoa, self.district, hh_type, hh_digital)
+        geographies = [(la, lsoa) for la in input_dict for lsoa in input_dict[la]]
+        counts = [max(int(input_dict[la][lsoa]), 0) for la, lsoa in geographies]
+
+        return [geographies[i] for i in np.repeat(np.arange(len(geographies)), counts)[:number]]
 
     def create_households(self):
 
@@ -163,24 +173,23 @@ class District(object):
             # get hh data for current type
             hh_input_data = self.input_data['households'][hh_type]
 
-            for i in range(hh_input_data['number']):
+            # initial actions of all the households of the type are set together
+            types, digital, times, engaged = self.initial_actions(hh_input_data, self.first_interaction, hh_type,
+                                                                  hh_input_data['number'])
 
-                # if allowed paper use different paper prop to if not...
-                if h.str2bool(hh_input_data['paper_allowed']):
-                    paper_prop = hh_input_data['paper_prop_pf']
-                else:
-                    paper_prop = hh_input_data['paper_prop_df']
+            # define where the hh are located
+            geographies = self.allocate_geography(hh_input_data['cca_makeup'], hh_input_data['number'])
 
-                # set if digital here?
-                hh_digital = h.set_preference(paper_prop, self.rnd)
+            for i in range(hh_input_data['number']):
 
-                # define where the hh is located
-                hh_geog = self.return_household_geog(hh_input_data['cca_makeup'], hh_type, hh_digital)
+                hh_digital = bool(digital[i])
+                hh_geog = oo.hh_geography(geographies[i][0], geographies[i][1], self.district, hh_type, hh_digital)
 
                 self.total_households += 1
 
-                # determine initial HH action
-                hh_action = self.initial_action(hh_input_data, self.first_interaction, hh_type, hh_geog, hh_digital)
+                # do nothing return 0 time
+                hh_time = float(times[i]) if types[i] != 'do_nothing' else 0
+                hh_action = oo.initial_action(str(types[i]), hh_digital, hh_time, bool(engaged[i]))
 
                 if hh_action.digital:
                     time_to_use = hh_action.time + hh_input_data['delay']['digital']
@@ -250,15 +259,11 @@ class District(object):
                                                                                    time_to_use))
                 else:
                     # create a household instance passing initial state
-                    self.households.append(household.Household(self.rep,
-                                                               self.env,
-                                                               self,
-                                                               self.rep.total_hh,
-                                                               hh_type,
-                                                               hh_input_data,
-                                                               hh_action,
-                                                               hh_geog.la,
-                                                               hh_geog.lsoa))
+                    self.households.append(self.hh_table.add(self.rep.total_hh,
+                                                             hh_type,
+                                                             hh_geog.la,
+                                                             hh_geog.lsoa,
+                                                             hh_action))
 
                 # if self.rep.reps == 1:
                 if self.rep.reps > 0 and oo.record_hh_record:
@@ -294,83 +299,53 @@ class District(object):
                                                letter_data,
                                                letter))
 
-    def initial_action(self, input_data, first_interaction, hh_type, hh_geog, hh_digital):
+    def initial_actions(self, input_data, first_interaction, hh_type, number):
+        """returns arrays of the type, digital preference, time and engagement of the initial actions of the passed
+        number of households with the passed input data. The random numbers for all the households are drawn
+        together"""
 
-        if hh_digital or h.str2bool(input_data['paper_allowed']):
-            # use default
-            behaviour = 'default'
+        paper_allowed = h.str2bool(input_data['paper_allowed'])
+
+        # if allowed paper use different paper prop to if not...
+        if paper_allowed:
+            paper_prop = input_data['paper_prop_pf']
         else:
-            # use alt
-            behaviour = 'alt'
+            paper_prop = input_data['paper_prop_df']
+
+        # set if digital here
+        digital = self.hh_rnd.uniform(0, 100, number) > int(paper_prop)
 
-        # set values to use
-        hh_resp = input_data['behaviours'][behaviour]['response']
+        # use default behaviour if digital or paper allowed, alt otherwise
+        default = digital | paper_allowed
+        hh_resp = np.where(default, input_data['behaviours']['default']['response'],
+                           input_data['behaviours']['alt']['response'])
         # if call centre not in sim set call probability to zero even if input says otherwise
         if self.rep.total_ad_instances > 0:
-            hh_help = input_data['behaviours'][behaviour]['help']
+            hh_help = np.where(default, input_data['behaviours']['default']['help'],
+                               input_data['behaviours']['alt']['help'])
         else:
-            hh_help = 0
+            hh_help = np.zeros(number)
 
-        response_test = self.rnd.uniform(0, 100)  # represents the COA to be taken.
+        response_test = self.hh_rnd.uniform(0, 100, number)  # represents the COA to be taken.
 
         # also at this point test if, if no barriers were in place, if they would be engaged or not...
-        if response_test <= input_data['behaviours']['default']['response']:
-            hh_eng = True
-        else:
-            hh_eng = False
-
-        if response_test <= hh_resp:
-            # respond but test when
-            return self.early_responder(input_data, hh_digital, first_interaction, hh_type, hh_eng)
-
-        elif hh_resp < response_test <= hh_resp + hh_help:
-            # call for help return when
-            return self.help(input_data, hh_digital, first_interaction, hh_type, hh_eng)
-        else:
-            # do nothing return 0 time
-            return oo.initial_action('do_nothing', hh_digital, 0, hh_eng)
-            # return self.do_nothing(input_data, digital, first_interaction, hh_type, hh_eng)
-
-    def early_responder(self, input_data, digital, first_interaction, hh_type, hh_eng):
-        # returns if the household will respond before any other interactions. "early" if yes "late" otherwise.
-
-        response_time = h.set_household_response_time(self.rep,
-                                                      input_data,
-                                                      hh_type,
-                                                      digital)
-
-        if digital and response_time + input_data['delay']['digital'] <= first_interaction:
-
-            # add a counter to the district so we know how many hh have responded early
-            self.early_responders += 1
-
-            return oo.initial_action('early', digital, response_time, hh_eng)
-
-        elif not digital and h.str2bool(input_data['paper_allowed']) \
-                and response_time + input_data['delay']['paper'] <= first_interaction:
-
-            self.early_responders += 1
-            return oo.initial_action('early', digital, response_time, hh_eng)
-
-        else:
-
-            return oo.initial_action('late', digital, response_time, hh_eng)
-
-    def help(self, input_data, digital, first_interaction, hh, hh_eng):
-
-        # below uses response time profile - will need to update this to a "call" profile?
-        response_time = h.set_household_call_time(self.rep)
-
-        return oo.initial_action('help', digital, response_time, hh_eng)
-
-    #def do_nothing(self, input_data, digital, first_interaction, hh, hh_eng):
-
-        #return oo.initial_action('do_nothing', digital, 0)
-
-
+        engaged = response_test <= input_data['behaviours']['default']['response']
 
+        respond = response_test <= hh_resp
+        call = ~respond & (response_test <= hh_resp + hh_help)
 
+        times = np.zeros(number)
+        times[respond] = h.set_household_response_times(self.rep, input_data, hh_type, self.response_rnd,
+                                                         np.sum(respond))
+        times[call] = h.set_household_call_times(self.rep, self.call_rnd, np.sum(call))
 
+        # respond before any other interactions if the return would arrive before the first interaction
+        delay = np.where(digital, input_data['delay']['digital'], input_data['delay']['paper'])
+        early = respond & default & (times + delay <= first_interaction)
 
+        # add a counter to the district so we know how many hh have responded early
+        self.early_responders += int(np.sum(early))
 
+        types = np.where(early, 'early', np.where(respond, 'late', np.where(call, 'help', 'do_nothing')))
 
+        return types, digital, times, engaged
@@ -0,0 +1,127 @@
+"""module used to find the waits and abandonment of a call centre analytically rather than by simulating each
+adviser. Over a short interval a call centre is treated as an M/M/n+D queue in steady state: calls arrive at random at
+a fixed rate, n advisers handle them in exponentially distributed times and callers hang up if not answered within a
+fixed renege time. This is the Erlang-A model with the fixed patience used by the simulation in place of exponential
+patience. With no renege time it is the Erlang-C model.
+
+The wait a caller would have to be answered, the virtual wait, has an atom at zero, when an adviser is free, and a
+density of
+
+    f(x) = arrival_rate * exp((arrival_rate - n * service_rate) * x) / norm    for 0 < x < renege
+
+with callers whose virtual wait is the renege time or more hanging up (Zeltyn and Mandelbaum, 2005). Waits are drawn
+from this distribution by inverting its cdf"""
+
+import math
+
+
+def erlang_ratio(offered_load, advisers):
+    """returns the sum of offered_load ** j / j! over j from 0 to advisers - 1 divided by its last term. Returns inf
+    if too large to represent, in which case callers never wait"""
+
+    term = 1.0
+    total = 1.0
+
+    for j in range(advisers - 1, 0, -1):
+        term *= j / offered_load
+        total += term
+        if total > 1e300:
+            return math.inf
+
+    return total
+
+
+class QueueStats(object):
+    """the distribution of the wait of a caller to a call centre with the passed number of advisers, over an interval
+    with the passed arrival rate (calls per hour), mean handle time (hours) and renege time (hours, None if callers
+    never hang up)"""
+
+    def __init__(self, arrival_rate, handle_time, advisers, renege=None):
+
+        self.arrival_rate = arrival_rate
+        self.handle_time = handle_time
+        self.advisers = advisers
+        self.renege = math.inf if renege is None else renege
+
+        service_rate = advisers / handle_time  # rate calls are handled when every adviser is busy
+        self.growth = arrival_rate - service_rate  # rate of growth of the density of the virtual wait
+
+        if arrival_rate <= 0:
+            epsilon = math.inf
+        else:
+            epsilon = erlang_ratio(arrival_rate * handle_time, advisers)
+
+        # terms are scaled by exp(-growth * renege) when the density grows so they can be represented
+        self.scaled = self.growth > 0 and self.renege < math.inf
+        self.scale = math.exp(-self.growth * self.renege) if self.scaled else 1.0
+
+        if epsilon == math.inf:
+            self.norm = math.inf
+            self.p_no_wait = 1.0
+            self.p_abandon = 0.0
+            return
+
+        if self.renege == math.inf:
+            if self.growth >= 0:
+                raise ValueError("call centre with no renege time cannot handle the calls offered")
+            # integral of the density over all waits
+            waiting = arrival_rate / -self.growth
+            tail = 0.0
+        elif self.scaled:
+            waiting = arrival_rate * (1 - self.scale) / self.growth
+            tail = arrival_rate / service_rate
+        elif self.growth == 0:
+            waiting = arrival_rate * self.renege
+            tail = arrival_rate / service_rate
+        else:
+            waiting = arrival_rate * math.expm1(self.growth * self.renege) / self.growth
+            tail = arrival_rate * math.exp(self.growth * self.renege) / service_rate
+
+        self.norm = epsilon * self.scale + waiting + tail
+        self.p_no_wait = epsilon * self.scale / self.norm
+        self.p_abandon = tail / self.norm
+
+    def p_wait(self):
+        """returns the probability a caller is not answered straight away"""
+
+        return 1 - self.p_no_wait
+
+    def mean_answered_wait(self):
+        """returns the mean wait of callers that are answered"""
+
+        if self.p_no_wait == 1.0:
+            return 0.0
+
+        if self.renege == math.inf:
+            # integral of x * exp(growth * x) over all waits
+            integral = 1 / self.growth ** 2
+        elif self.growth == 0:
+            integral = self.renege ** 2 / 2
+        elif self.scaled:
+            integral = (self.growth * self.renege - 1 + self.scale) / self.growth ** 2
+        else:
+            integral = (math.exp(self.growth * self.renege) * (self.growth * self.renege - 1) + 1) / self.growth ** 2
+
+        return self.arrival_rate * integral / self.norm / (1 - self.p_abandon)
+
+    def wait(self, u):
+        """returns the wait of a caller given by the passed uniform draw and if they are answered. Callers that are
+        not answered wait the renege time"""
+
+        if u < self.p_no_wait:
+            return 0.0, True
+
+        if u >= 1 - self.p_abandon:
+            return self.renege, False
+
+        # invert the cdf of the virtual wait
+        y = (u - self.p_no_wait) * self.norm / self.arrival_rate
+
+        if self.scaled:
+            wait = self.renege + math.log(self.growth * y + self.scale) / self.growth
+        elif self.growth == 0:
+            wait = y
+        else:
+            wait = math.log1p(self.growth * y) / self.growth
+
+        return min(max(wait, 0.0), self.renege), True
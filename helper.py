@@ -9,7 +9,6 @@ import sys
 import response_profiles
 import call_profiles as cp
 import numpy as np
-import pandas as pd
 
 l = Lock()  # global declaration...can I avoid this
 
@@ -59,6 +58,33 @@ def return_time_key(input_dict, time):
             return key
 
 
+def rate_table(rates):
+    """compiles a dict of rates keyed by day of week and then hour, as looked up by return_time_key, into a 7x24
+    array of the rate in each hour of each day. Hours with no rate are nan"""
+
+    table = np.full((7, 24), np.nan)
+
+    for day, day_rates in rates.items():
+        for hour in range(24):
+            key = return_time_key(day_rates, hour)
+            if key is not None:
+                table[int(day), hour] = day_rates[key]
+
+    return table
+
+
+def optimal_hours(rates):
+    """returns a 7x24 array that is true in the hours of each day with the highest of the passed rates"""
+
+    table = rate_table(rates)
+    optimal = np.zeros((7, 24), dtype=bool)
+
+    for day, day_rates in rates.items():
+        optimal[int(day)] = table[int(day)] == max(day_rates.values())
+
+    return optimal
+
+
 def str2bool(value):
     # test added
     return str(value).lower() in ("True", "true", "1")
@@ -73,8 +99,8 @@ def bool2value(x):
 
 
 def beta_dist(rep, alpha, beta, sim_days_left):
-    # return (rep.rnd.betavariate(alpha, beta))*(rep.sim_hours - rep.env.now)
-    return int((rep.rnd.betavariate(alpha, beta))*sim_days_left)
+    # return (rep.streams.response.betavariate(alpha, beta))*(rep.sim_hours - rep.env.now)
+    return int((rep.streams.response.betavariate(alpha, beta))*sim_days_left)
 
 
 def write_output(output_data, out_path, ed_id):
@@ -125,17 +151,6 @@ def dict_size(a_dict):
     return size
 
 
-def set_preference(paper_prop, rnd):
-    """sets whether the hh prefers paper or digital"""
-    paper_test = rnd.uniform(0, 100)
-
-    if paper_test <= int(paper_prop):
-
-        return False  # paper
-
-    return True  # digital
-
-
 def set_behaviour(digital, input_data, behaviour, rnd):
 
     if digital or input_data["paper_allowed"]:
@@ -147,67 +162,46 @@ def set_behaviour(digital, input_data, behaviour, rnd):
         return input_data['behaviours']['alt'][behaviour][min(len_beh - 1)]
 
 
-def set_household_response_time(rep, input_data, hh_type, digital):
-
-    # returns the day a response is sent based upon specified distribution
-    response_day = response_profiles.sample_day_2011_all(rep, hh_type)
-
-    # returns the time of day the response is received - again final number and type of dists to use to be determined.
-    if response_day == rep.census_day:
-        # use census day profile
-        day_response_time = rep.rnd.gauss(input_data['response_time']['census_day'][0],
-                                          input_data['response_time']['census_day'][1])
-    else:
-        # use some other profile
-        day_response_time = rep.rnd.gauss(input_data['response_time']['other'][0],
-                                          input_data['response_time']['other'][1])
+def set_household_response_times(rep, input_data, hh_type, rnd, size):
+    # returns an array of the times responses are sent for the passed number of households, drawn with the passed
+    # batch generator
 
-    final_response_time = (response_day*24) + day_response_time
+    response_day = response_profiles.sample_days_2011_all(rep, hh_type, rnd, size)
 
-    # comment out if do not need to check sampled data is correct
-    # with open('sampled_data.csv', 'a') as fp:
-    #     writer = csv.writer(fp)
-    #     writer.writerow([final_response_time])
+    # use census day profile on census day and some other profile otherwise
+    census_day = input_data['response_time']['census_day']
+    other = input_data['response_time']['other']
+    on_census_day = response_day == rep.census_day
+    mean = np.where(on_census_day, census_day[0], other[0])
+    sd = np.where(on_census_day, census_day[1], other[1])
 
-    #    fp.close()
+    return (response_day*24) + rnd.normal(mean, sd, size)
 
-    return final_response_time
 
+def set_household_call_times(rep, rnd, size):
+    # returns an array of the times calls are made for the passed number of households, drawn with the passed batch
+    # generator
 
-def set_household_call_time(rep):
-    # returns the day and time a call is made based upon specified distribution
-    call_day = cp.sample_calls_2011_all(rep)
+    call_day = cp.sample_calls_all(rep, rnd, size)
 
     dow = (rep.start_day + call_day % 7) % 7
+    day = np.where(call_day == rep.census_day, 'census day',
+                   np.where(dow < 6, 'weekday',
+                            np.where(dow == 6, 'saturday', 'sunday')))
 
-    if call_day == rep.census_day:
+    day_call_time = cp.sample_calls_day_all(rep, day, rnd)
 
-        day = 'census day'
-
-    elif dow < 6:
-
-        day = 'weekday'
-
-    elif dow == 6:
-
-        day = 'saturday'
-
-    else:
-
-        day = 'sunday'
-
-    day_call_time = cp.sample_calls_day_2011(rep, day)
-
-    final_call_time = ((call_day - 1) * 24) + day_call_time
-
-    return final_call_time
+    return ((call_day - 1) * 24) + day_call_time
 
 
 def get_entity_time(entity, type="start"):
 
     date_type = type + "_date"
+    # start of the first shift or end of the last shift of the day
+    times = entity.calendar.starts
     index = 0
     if type == "end":
+        times = entity.calendar.ends
         index = -1
 
     try:
@@ -217,8 +211,7 @@ def get_entity_time(entity, type="start"):
         date_sim = (date - entity.rep.start_date).total_seconds() / 3600
 
         # convert time of that day to sim time
-        time = entity.input_data['availability'][str(date.weekday())][index]
-        time_sim = make_time_decimal(dt.time(*map(int, time.split(':'))))
+        time_sim = times[date.weekday()][index]
 
         return date_sim + time_sim
 
@@ -273,10 +266,7 @@ def get_time_of_return(input_time, rep):
 
         day = 'sunday'
 
-    rt = rep.call_day_df[day].as_matrix()
-    rt = rt[18:]
-    r = rep.rnd.uniform(0, 1)
-    time = (np.argwhere(rt == min(rt[(rt - r) > 0]))[0][0])/2 + rep.rnd.uniform(0, 0.5)
+    time = rep.return_time_samplers[day].sample(rep.streams.response)/2 + rep.streams.response.uniform(0, 0.5)
     return time
 
 
@@ -288,22 +278,17 @@ def generate_list(input_file_path, col_num):
         return temp_list
 
 
-def output_summary(summary_out_path, input_dict, dict_name, run_id, rep_id):
+def summary_to_arrays(input_dict):
+    """converts a summary dict of the form {key: {code: daily counts or total}} to a dict of the form
+    {key: (list of codes, 2d array with a row for each code)} so it can be cheaply passed back and summed"""
+
+    summary_arrays = {}
 
     for k, v in input_dict.items():
-        # create a folder if one doesn't already exist - new folder per rep
-        temp_output_path = os.path.join(summary_out_path, dict_name, k, run_id)
-
-        l.acquire()  # seems this is needed for multiple reps
-        if not os.path.isdir(temp_output_path):
-            # if not
-            os.makedirs(temp_output_path)
-
-        # then check if specific file exists
-        temp_file_path = os.path.join(temp_output_path, str(rep_id) + '.csv')
-        df = pd.DataFrame.from_dict(v, orient='index')
-        df.to_csv(temp_file_path)
-        l.release()
+        codes = list(v.keys())
+        summary_arrays[k] = (codes, np.array(list(v.values()), dtype=float).reshape(len(codes), -1))
+
+    return summary_arrays
 
 
 def time_from_start(rep, input_date):
@@ -5,80 +5,456 @@ from simpy.util import start_delayed
 import output_options as oo
 import helper as h
 import math
-import datetime as dt
 import call_profiles as cp
-
-
-class Household(object):
-
-    # Create an instance of the class
-    def __init__(self, rep, env, district, hh_id, hh_type, input_data, initial_action, la, lsoa):
+import numpy as np
+from bisect import bisect_left, insort
+
+
+# initial actions of households represented by an instance - early responders are recorded directly
+statuses = ['late', 'help', 'do_nothing']
+
+# columns of the household table and their types
+columns = [('hh_id', np.int64),
+           ('hh_type_code', np.int32),
+           ('la_code', np.int32),
+           ('lsoa_code', np.int32),
+           ('status_code', np.int8),
+           ('digital', np.bool_),
+           ('initial_time', np.float64),
+           ('engaged', np.bool_),
+           ('priority', np.float64),
+           ('paper_allowed', np.bool_),
+           ('paper_on_request', np.bool_),
+           ('resp_planned', np.bool_),
+           ('resp_time', np.float64),
+           ('resp_level', np.float64),
+           ('help_level', np.float64),
+           ('responded', np.bool_),
+           ('return_sent', np.bool_),
+           ('return_received', np.bool_),
+           ('visits', np.int32),
+           ('time_spent_visits', np.float64),
+           ('calls', np.int32),
+           ('arranged_visit', np.bool_),
+           ('letter_count', np.int32)]
+
+
+class HouseholdTable(object):
+    """stores the state of the households of a district as a column for each attribute, so a household takes a few
+    bytes rather than an object of its own and the households can be queried in bulk. Households are views of a row of
+    the table"""
+
+    def __init__(self, rep, district, capacity):
 
         self.rep = rep
-        self.rnd = self.rep.rnd
-        self.env = env
+        self.env = rep.env
         self.district = district
-        self.hh_id = hh_id
-        self.hh_type = hh_type
-        self.input_data = input_data
-        self.la = la
-        self.lsoa = lsoa
-
-        self.output_data = self.rep.output_data
-        self.initial_status = initial_action.type
-        self.digital = initial_action.digital
-        self.initial_time = initial_action.time
-        self.engaged = initial_action.engaged
-        self.district_name = district.district
-
-        self.priority = self.input_data['priority']
-        self.paper_allowed = h.str2bool(self.input_data['paper_allowed'])
-        self.paper_on_request = h.str2bool(self.input_data['paper_on_request'])
+        self.output_data = rep.output_data
+        self.streams = rep.streams
+
+        # hh types, la, lsoa and initial actions are stored as codes
+        self.statuses = statuses
+        self.hh_types = sorted(list(district.input_data['households'].keys()))
+        self.hh_type_codes = dict((hh_type, i) for i, hh_type in enumerate(self.hh_types))
+        self.input_data = [district.input_data['households'][hh_type] for hh_type in self.hh_types]
+        self.las = []
+        self.la_codes = {}
+        self.lsoas = []
+        self.lsoa_codes = {}
+
+        # inputs of each hh type used in bulk queries
+        self.max_visits = np.array([hh_input['max_visits'] for hh_input in self.input_data])
+        self.fu_start = np.array([h.time_from_start(rep, hh_input['FU_start_date']) for hh_input in self.input_data])
+
+        # rate in each hour of each day of the week of each hh type and if it is the best time to visit
+        self.rates = dict((rate_type, np.array([h.rate_table(hh_input[rate_type]) for hh_input in self.input_data]))
+                          for rate_type in ['contact_rate', 'success_rate'])
+        self.optimal_hours = np.array([h.optimal_hours(hh_input['contact_rate']) for hh_input in self.input_data])
+
+        self.size = 0
+        for name, dtype in columns:
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+
+        self.households = []  # view of each row
+        self.order = np.arange(0)  # rows in the order of the district's list of households
+        self.visit_queue = VisitQueue(self)
+
+    def code(self, codes, values, value):
+        # returns the code of the passed value, adding it if new
+
+        if value not in codes:
+            codes[value] = len(values)
+            values.append(value)
+
+        return codes[value]
+
+    def add(self, hh_id, hh_type, la, lsoa, initial_action):
+        """adds a row for a household with the passed initial state and returns a view of it"""
+
+        i = self.size
+        self.size += 1
+        input_data = self.input_data[self.hh_type_codes[hh_type]]
+
+        self.hh_id[i] = hh_id
+        self.hh_type_code[i] = self.hh_type_codes[hh_type]
+        self.la_code[i] = self.code(self.la_codes, self.las, la)
+        self.lsoa_code[i] = self.code(self.lsoa_codes, self.lsoas, lsoa)
+        self.status_code[i] = statuses.index(initial_action.type)
+        self.digital[i] = initial_action.digital
+        self.initial_time[i] = initial_action.time
+        self.engaged[i] = initial_action.engaged
+
+        self.priority[i] = input_data['priority']
+        self.paper_allowed[i] = h.str2bool(input_data['paper_allowed'])
+        self.paper_on_request[i] = h.str2bool(input_data['paper_on_request'])
 
         # flags to keep track of what the hh is doing/has done
-        if self.initial_time > 0 and (self.initial_status == 'early' or self.initial_status == 'late'):
-            self.resp_planned = True
+        self.resp_planned[i] = initial_action.time > 0 and initial_action.type in ['early', 'late']
+
+        household = Household(self, i)
+        self.households.append(household)
+
+        return household
+
+    def set_order(self, households):
+        """sets the order rows are returned by queries to that of the passed list of households and trims the columns
+        to the households added"""
+
+        for name, dtype in columns:
+            setattr(self, name, getattr(self, name)[:self.size].copy())
+
+        self.order = np.array([household.index for household in households], dtype=np.int64)
+        self.visit_queue.build(self.order)
+
+    def select(self, mask):
+        # returns views of the rows selected by the passed mask, which is in the order set, ordered by priority
+
+        rows = self.order[mask]
+        rows = rows[np.argsort(self.priority[rows], kind='stable')]
+
+        return [self.households[i] for i in rows]
+
+    def to_visit(self, time):
+        """returns an iterator of the households that have not responded, have had fewer than the max visits and can
+        be visited at the passed time, ordered by priority"""
+
+        return self.visit_queue.households(time)
+
+    def to_send_letters(self, targets, blanket):
+        """returns the households of the passed target types that letters are sent to, ordered by priority. Unless a
+        blanket letter only households that have not responded are included"""
+
+        target_codes = [code for hh_type, code in self.hh_type_codes.items() if hh_type in targets]
+        mask = np.isin(self.hh_type_code[self.order], target_codes)
+        if not blanket:
+            mask &= ~self.responded[self.order]
+
+        return self.select(mask)
+
+    def not_returned(self):
+        """returns the households that have not sent a return, in the order set"""
+
+        return [self.households[i] for i in self.order[~self.return_sent[self.order]]]
+
+
+class SortedKeys(object):
+    """a sorted list of keys held in blocks of a few hundred, so adding or removing a key takes a binary search of the
+    last key of each block and of a single block, and moves only the keys of that block"""
+
+    load = 500  # keys in each block when built - a block is split once it has twice as many
+
+    def __init__(self, keys=()):
+
+        self.set(sorted(keys))
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for block in self.blocks:
+            yield from block
+
+    def set(self, keys):
+        # sets the keys to the passed sorted list
+
+        self.blocks = [keys[i:i + self.load] for i in range(0, len(keys), self.load)]
+        self.maxes = [block[-1] for block in self.blocks]
+        self.size = len(keys)
+
+    def add(self, key):
+        """adds the passed key"""
+
+        if not self.blocks:
+            self.blocks.append([key])
+            self.maxes.append(key)
+            self.size = 1
+            return
+
+        i = min(bisect_left(self.maxes, key), len(self.blocks) - 1)
+        block = self.blocks[i]
+        insort(block, key)
+        self.maxes[i] = block[-1]
+        self.size += 1
+
+        if len(block) > 2 * self.load:
+            self.blocks[i:i + 1] = [block[:self.load], block[self.load:]]
+            self.maxes[i:i + 1] = [block[self.load - 1], block[-1]]
+
+    def remove(self, key):
+        """removes the passed key, which must be present"""
+
+        i = bisect_left(self.maxes, key)
+        block = self.blocks[i]
+        del block[bisect_left(block, key)]
+        self.size -= 1
+
+        if block:
+            self.maxes[i] = block[-1]
+        else:
+            del self.blocks[i]
+            del self.maxes[i]
+
+
+class VisitQueue(object):
+    """the households of a district that can still be visited, kept in the order of the visit lists - by priority and
+    then the order set - as their priority, visits and responses change. Changes are applied when the queue is next
+    read, each with a binary search of the queue, so the visit lists are not found by a scan and sort of the district"""
+
+    def __init__(self, table):
+
+        self.table = table
+        self.keys = SortedKeys()  # (priority, rank, row) of each household queued
+        self.queued = {}  # key of each row queued
+        self.rank = np.arange(0)  # position of each row in the order set
+        self.started = np.zeros(len(table.hh_types), dtype=np.bool_)  # if follow up has started for each hh type
+        self.changed_rows = set()  # rows changed since the queue was last read
+
+    def build(self, order):
+        """empties the queue and sets the order of households of equal priority to that of the passed rows"""
+
+        self.rank = np.empty(len(order), dtype=np.int64)
+        self.rank[order] = np.arange(len(order))
+        self.keys = SortedKeys()
+        self.queued = {}
+        self.started[:] = False
+        self.changed_rows = set()
+
+    def changed(self, row):
+        """notes the passed row has changed in a way that may move it in, into or out of the queue"""
+
+        self.changed_rows.add(row)
+
+    def start(self, time):
+        # adds the households of the hh types follow up has started for by the passed time
+
+        for code in np.flatnonzero(~self.started & (self.table.fu_start <= time)):
+            self.started[code] = True
+            self.changed_rows.update(np.flatnonzero(self.table.hh_type_code == code).tolist())
+
+    def key(self, row):
+        # returns the key of the passed row if it can be visited, otherwise None
+
+        table = self.table
+        code = table.hh_type_code[row]
+        if self.started[code] and not table.responded[row] and table.visits[row] < table.max_visits[code]:
+            return float(table.priority[row]), int(self.rank[row]), row
+
+        return None
+
+    def update(self):
+        # moves the changed rows to their place in the queue
+
+        if len(self.changed_rows) * 8 > len(self.keys):
+            # cheaper to sort again than to move each row - as when follow up starts for a hh type
+            keys = [key for key in self.keys if key[2] not in self.changed_rows]
+            self.queued = dict((key[2], key) for key in keys)
+            for row in self.changed_rows:
+                key = self.key(row)
+                if key:
+                    keys.append(key)
+                    self.queued[row] = key
+            keys.sort()
+            self.keys.set(keys)
+
         else:
-            self.resp_planned = False
-
-        self.resp_time = 0
-        self.resp_level = 0
-        self.help_level = 0
-        self.responded = False
-        self.return_sent = False
-        self.return_received = False
-        self.status = ''
-        self.visits = 0
-        self.time_spent_visits = 0
-        self.calls = 0
-        self.arranged_visit = False
-        self.letter_count = 0
-
-    def action(self):
-        # directs the household to follow the COA set on initialisation at the relevant time
-
-        yield self.env.timeout(self.initial_time)
+            for row in self.changed_rows:
+                if row in self.queued:
+                    self.keys.remove(self.queued.pop(row))
+
+                key = self.key(row)
+                if key:
+                    self.keys.add(key)
+                    self.queued[row] = key
+
+        self.changed_rows = set()
+
+    def households(self, time):
+        """returns an iterator of the households that can be visited at the passed time in order"""
+
+        self.start(time)
+        if self.changed_rows:
+            self.update()
+
+        households = self.table.households
+        return (households[key[2]] for key in self.keys)
+
+
+def column(name, cast):
+    # returns a property that gets and sets the household's row of the passed column
+
+    def get_value(self):
+        return cast(getattr(self.table, name)[self.index])
+
+    def set_value(self, value):
+        getattr(self.table, name)[self.index] = value
+
+    return property(get_value, set_value)
+
+
+def queued_column(name, cast):
+    # returns a property as column that also passes changes to the household's row on to the visit queue
+
+    def get_value(self):
+        return cast(getattr(self.table, name)[self.index])
+
+    def set_value(self, value):
+        getattr(self.table, name)[self.index] = value
+        self.table.visit_queue.changed(self.index)
+
+    return property(get_value, set_value)
+
+
+def coded_column(name, values):
+    # returns a property that gets the value of the household's row of the passed column of codes
+
+    def get_value(self):
+        return getattr(self.table, values)[getattr(self.table, name)[self.index]]
+
+    return property(get_value)
+
+
+def shared(name):
+    # returns a property that gets the passed attribute of the table, shared by all its households
+
+    def get_value(self):
+        return getattr(self.table, name)
+
+    return property(get_value)
+
+
+class Household(object):
+    """a household represented in the simulation. The state of the household is held in a row of the household table
+    of its district"""
+
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+
+        self.table = table
+        self.index = index
+
+    rep = shared('rep')
+    env = shared('env')
+    district = shared('district')
+    output_data = shared('output_data')
+    streams = shared('streams')
+
+    hh_type = coded_column('hh_type_code', 'hh_types')
+    la = coded_column('la_code', 'las')
+    lsoa = coded_column('lsoa_code', 'lsoas')
+    initial_status = coded_column('status_code', 'statuses')
+
+    hh_id = column('hh_id', int)
+    digital = column('digital', bool)
+    initial_time = column('initial_time', float)
+    engaged = column('engaged', bool)
+    priority = queued_column('priority', float)
+    paper_allowed = column('paper_allowed', bool)
+    paper_on_request = column('paper_on_request', bool)
+    resp_planned = column('resp_planned', bool)
+    resp_time = column('resp_time', float)
+    resp_level = column('resp_level', float)
+    help_level = column('help_level', float)
+    responded = queued_column('responded', bool)
+    return_sent = column('return_sent', bool)
+    return_received = column('return_received', bool)
+    visits = queued_column('visits', int)
+    time_spent_visits = column('time_spent_visits', float)
+    calls = column('calls', int)
+    arranged_visit = column('arranged_visit', bool)
+    letter_count = column('letter_count', int)
+
+    @property
+    def input_data(self):
+        return self.table.input_data[self.table.hh_type_code[self.index]]
+
+    @property
+    def district_name(self):
+        return self.table.district.district
+
+    def rate(self, rate_type):
+        # returns the rate of the passed type, contact_rate or success_rate, for the household at the current time
+
+        return self.table.rates[rate_type][self.table.hh_type_code[self.index], h.current_day(self),
+                                           int(self.env.now % 24)]
+
+    def optimal_time(self):
+        # returns true if the current time is the best time to visit the household
+
+        return bool(self.table.optimal_hours[self.table.hh_type_code[self.index], h.current_day(self),
+                                             int(self.env.now % 24)])
+
+    def next_optimal_time(self):
+        # returns the sim time of the start of the next hour, from the current one, that is the best time to visit the
+        # household or None if there is none
+
+        optimal_hours = self.table.optimal_hours[self.table.hh_type_code[self.index]].ravel()  # each hour of the week
+        ahead = np.flatnonzero(np.roll(optimal_hours, -(h.current_day(self) * 24 + int(self.env.now % 24))))
+
+        if not len(ahead):
+            return None
+
+        return math.floor(self.env.now) + int(ahead[0])
+
+    def activate(self):
+        # sets the household to follow the COA set on initialisation. No process is run for the household until it
+        # acts - letters, visits and paper drops start processes of their own when they reach the household
+
+        if self.initial_status == 'late' or self.initial_status == 'help':
+            self.env.timeout(self.initial_time).callbacks.append(self.action)
+
+        elif oo.record_do_nothing:
+            # nowt
+            self.output_data['Do_nothing'].append(oo.generic_output(self.rep.reps,
+                                                                    self.district.district,
+                                                                    self.la,
+                                                                    self.lsoa,
+                                                                    self.digital,
+                                                                    self.hh_type,
+                                                                    self.hh_id,
+                                                                    self.env.now))
+
+    def action(self, event):
+        # called at the time set on initialisation to start the planned response or call
 
         if self.initial_status == 'late' and not self.return_sent:
             # normal response
-            yield self.env.process(self.household_returns(self.calc_delay()))
+            self.env.process(self.household_returns(self.calc_delay()))
 
         elif self.initial_status == 'help' and not self.return_sent:
             # help
-            yield self.env.process(self.contact())
+            self.env.process(self.contact())
 
-        else:
+        elif oo.record_do_nothing:
             # nowt
-            if oo.record_do_nothing:
-                self.output_data['Do_nothing'].append(oo.generic_output(self.rep.reps,
-                                                                        self.district.district,
-                                                                        self.la,
-                                                                        self.lsoa,
-                                                                        self.digital,
-                                                                        self.hh_type,
-                                                                        self.hh_id,
-                                                                        self.env.now))
-        yield self.env.timeout(0)  # do nothing more
+            self.output_data['Do_nothing'].append(oo.generic_output(self.rep.reps,
+                                                                    self.district.district,
+                                                                    self.la,
+                                                                    self.lsoa,
+                                                                    self.digital,
+                                                                    self.hh_type,
+                                                                    self.hh_id,
+                                                                    self.env.now))
 
     def contact(self):
         # routing for the type of contact
@@ -136,7 +512,7 @@ class Household(object):
     def action_test(self, interaction_type):
         # tests what a household will do next after an interaction and returns the action and time of action.
 
-        test_value = self.rnd.uniform(0, 100)
+        test_value = self.streams.call.uniform(0, 100)
         # test if default or alt
         behaviour = self.default_behaviour()
 
@@ -159,13 +535,9 @@ class Household(object):
             if v['start_time'] < time <= v['end_time']:
 
                 # then between each set of times
-                current_dow = str((self.rep.start_date + dt.timedelta(days=math.floor(time / 24))).weekday())
-                for i in range(0, len(v['availability'][current_dow]), 2):
-                    in_time = h.make_time_decimal(dt.time(*map(int, v['availability'][current_dow][i].split(':'))))
-                    out_time = h.make_time_decimal(dt.time(*map(int, v['availability'][current_dow][i+1].split(':'))))
-
-                    if in_time <= self.env.now % 24 < out_time:
-                        return k
+                current_dow = (self.rep.start_day + math.floor(time / 24)) % 7
+                if v['calendar'].on_shift(current_dow, self.env.now % 24):
+                    return k
 
         return None
 
@@ -178,11 +550,26 @@ class Household(object):
         # is one of these types available?
         adviser = self.adviser_check(called_at)
 
-        current_ad = yield self.rep.adviser_store.get(lambda item: item.type == adviser)
-        wait_time = self.env.now - called_at
+        # the caller waits for an adviser until they renege. Renege time a fixed value for now. Determine suitable
+        # distribution from paradata or call centre MI.
+        if self.rep.call_centre.analytic:
+            wait_time, current_ad = self.rep.call_centre.call(adviser, self.input_data["renege"], self.streams.call)
+            yield self.env.timeout(wait_time)
+            answered = current_ad is not None
+
+        else:
+            request = self.rep.call_centre.get(adviser)
+            yield request | self.env.timeout(self.input_data["renege"])
+            wait_time = self.env.now - called_at
+
+            answered = request.triggered
+            if answered:
+                current_ad = request.value
+            else:
+                # hang up and leave the queue
+                request.cancel()
 
-        # renege time a fixed value for now. Determine suitable distribution from paradata or call centre MI.
-        if wait_time >= self.input_data["renege"]:
+        if not answered:
             # hang up
 
             if oo.record_call_renege:
@@ -195,10 +582,7 @@ class Household(object):
                                                                          self.hh_id,
                                                                          self.env.now))
 
-            self.rep.adviser_store.put(current_ad)
-
-            # record wait times for stats generation - wait time her eis how long they would of had to wait
-            # not how long they did wait - this is given by the renege time
+            # record wait times for stats generation - the time waited before hanging up
             if wait_time > 0:
                 self.record_wait_time(wait_time, self.input_data["renege"])
 
@@ -229,7 +613,7 @@ class Household(object):
 
     def phone_call_assist(self, current_ad):
 
-        da_test = self.rnd.uniform(0, 100)
+        da_test = self.streams.call.uniform(0, 100)
         # how effective current adviser type at conversion to digital
         da_effectiveness = current_ad.input_data['da_effectiveness'][self.hh_type]
 
@@ -276,17 +660,16 @@ class Household(object):
             # up priority and tag so a visit happens at time likely time to be in - or just set it to succeed - or both?
             self.priority -= 10
 
-            self.rep.adviser_store.put(current_ad)
+            self.rep.call_centre.put(current_ad)
             # self.arranged_visit = True  # basically has requested a visit so go at optimal time and move to front..
             self.arranged_visit = False
 
     def phone_call_outcome(self, current_ad):
 
         # digital by this point so just can you convince them to reply?
-        outcome_test = self.rnd.uniform(0, 100)
-        conversion_dict = self.input_data['success_rate'][str(h.current_day(self))]
+        outcome_test = self.streams.call.uniform(0, 100)
 
-        if outcome_test <= conversion_dict[h.return_time_key(conversion_dict, self.env.now)]:
+        if outcome_test <= self.rate('success_rate'):
 
             yield self.env.timeout(current_ad.input_data['call_times']['success'] / 60)
 
@@ -300,7 +683,7 @@ class Household(object):
                                                                               self.hh_id,
                                                                               self.env.now))
             self.resp_planned = True
-            self.rep.adviser_store.put(current_ad)
+            self.rep.call_centre.put(current_ad)
             self.rep.env.process(self.household_returns(self.calc_delay()))
 
         else:
@@ -316,7 +699,7 @@ class Household(object):
                                                                              self.hh_type,
                                                                              self.hh_id,
                                                                              self.env.now))
-            self.rep.adviser_store.put(current_ad)
+            self.rep.call_centre.put(current_ad)
 
     def household_returns(self, delay=0):
         """represents the hh returning their form - not the return being counted as a response by census"""
@@ -334,7 +717,7 @@ class Household(object):
                                                                          self.digital,
                                                                          self.hh_type,
                                                                          self.hh_id,
-                                                                         self.resp_time))
+                                                                         self.env.now))
 
             if self.calc_delay() == 0:  # digital
                 self.env.process(hq.ret_rec(self, self.rep))
@@ -400,7 +783,7 @@ class Household(object):
                                                                                                     self.env.now,
                                                                                                     reminder_type))
         # now move on to the relevant action based on extracted values
-        reminder_test = self.rnd.uniform(0, 100)
+        reminder_test = self.streams.letter.uniform(0, 100)
 
         if not self.resp_planned and reminder_test <= self.resp_level:
             if oo.record_reminder_success:
@@ -429,7 +812,7 @@ class Household(object):
         elif not self.resp_planned and (self.resp_level < reminder_test <= self.resp_level + self.help_level):
             # call for help...needs to be based on appropriate distribution...not a hardcoded uniform function!
             # also may not do this if intend to respond?
-            yield self.env.timeout(self.rnd.uniform(0, 8))
+            yield self.env.timeout(self.streams.letter.uniform(0, 8))
 
             if oo.record_do_nothing:
                 self.output_data[reminder_type + '_contact'].append(oo.generic_output(self.rep.reps,
@@ -460,7 +843,7 @@ class Household(object):
 
         if oo.record_call_wait_times:
             self.output_data['Call_wait_times'].append(oo.call_wait_times(self.rep.reps,
-                                                                          self.district.name,
+                                                                          self.district.district,
                                                                           self.la,
                                                                           self.lsoa,
                                                                           self.digital,
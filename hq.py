@@ -5,6 +5,10 @@ import helper as h
 import datetime
 from simpy.util import start_delayed
 import math
+import simpy
+import numpy as np
+import erlang
+import availability
 
 
 def ret_rec(household, rep):
@@ -76,12 +80,150 @@ class Adviser(object):
         self.start_date = datetime.datetime.strptime(self.input_data['start_date'], '%Y, %m, %d').date()
         self.end_date = datetime.datetime.strptime(self.input_data['end_date'], '%Y, %m, %d').date()
 
+        # time range - varies by day of week
+        self.set_avail_sch = input_data['availability']
+        self.calendar = availability.calendar(self.set_avail_sch)
+
         # date range in simpy format
         self.start_sim_time = h.get_entity_time(self, "start")  # the sim time the adviser starts work
         self.end_sim_time = h.get_entity_time(self, "end")  # the sim time the adviser ends work
 
-        # time range - varies by day of week
-        self.set_avail_sch = input_data['availability']
+
+class CallCentre(object):
+    """the advisers of the call centre. Advisers are held in a store for each adviser type so a caller only waits for,
+    and is only matched against, advisers of the type they need. Callers waiting for each type are served in the order
+    they called"""
+
+    analytic = False
+
+    def __init__(self, env, adviser_inputs):
+
+        self.env = env
+        self.stores = dict((ad_type, simpy.Store(env, capacity=int(ad_input['number'])))
+                           for ad_type, ad_input in adviser_inputs.items() if int(ad_input['number']) > 0)
+
+    def get(self, ad_type):
+        """returns a request for an adviser of the passed type"""
+
+        return self.stores[ad_type].get()
+
+    def put(self, adviser):
+        """returns the passed adviser to the call centre"""
+
+        return self.stores[adviser.type].put(adviser)
+
+
+class AnsweredCall(object):
+    """a call answered by the analytic call centre. Stands in for the adviser that answered it"""
+
+    def __init__(self, input_data, ad_type, answered_at):
+
+        self.input_data = input_data
+        self.type = ad_type
+        self.answered_at = answered_at
+
+
+class AnalyticCallCentre(object):
+    """call centre that draws the wait of each caller, and if they hang up, from the analytic queue model in erlang
+    rather than simulating each adviser. Used when "analytic call centre" is set to True in the run input.
+
+    The arrival rate in each interval is the number of calls households planned to make in it, as drawn from the call
+    profiles, scaled by the ratio of the calls made so far to those planned. This allows for calls diverted to paper
+    and calls prompted by letters, visits or calling back. The handle time is the mean of the calls answered so far"""
+
+    analytic = True
+    interval = 0.5  # hours - the resolution of the call profiles
+
+    def __init__(self, rep, adviser_inputs):
+
+        self.rep = rep
+        self.env = rep.env
+        self.adviser_inputs = adviser_inputs
+        self.advisers = dict((ad_type, int(ad_input['number'])) for ad_type, ad_input in adviser_inputs.items()
+                             if int(ad_input['number']) > 0)
+
+        # total and count of the handle times of each adviser type - starts from a query and success
+        self.handle_times = dict((ad_type, [(adviser_inputs[ad_type]['call_times']['query'] +
+                                             adviser_inputs[ad_type]['call_times']['success']) / 60, 1])
+                                 for ad_type in self.advisers)
+
+        self.planned = None  # calls planned in each interval - found once the households exist
+        self.current_interval = None
+        self.stats = {}  # queue stats of the current interval for each adviser type and renege time
+        self.arrivals = 0  # calls made in the current interval
+        self.calls_made = 0  # calls made before the current interval
+        self.calls_planned = 0  # calls planned before the current interval
+
+    def planned_calls(self):
+        # returns an array of the number of calls households planned to make in each interval
+
+        times = []
+        for district in self.rep.districts:
+            table = district.hh_table
+            times.append(table.initial_time[table.status_code == table.statuses.index('help')])
+
+        return np.bincount((np.concatenate(times + [np.zeros(0)]) // self.interval).astype(int))
+
+    def planned_in(self, interval):
+        return self.planned[interval] if interval < len(self.planned) else 0
+
+    def queue_stats(self, ad_type, renege):
+        """returns the queue stats for a caller to the passed adviser type with the passed renege time at the current
+        time, counting the caller as an arrival"""
+
+        interval = int(self.env.now // self.interval)
+
+        if interval != self.current_interval:
+            if self.planned is None:
+                self.planned = self.planned_calls()
+
+            if self.current_interval is not None:
+                self.calls_made += self.arrivals
+                self.calls_planned += self.planned_in(self.current_interval)
+
+            self.current_interval = interval
+            self.arrivals = 0
+            self.stats = {}
+
+        self.arrivals += 1
+
+        if (ad_type, renege) not in self.stats:
+            ratio = (self.calls_made + 1) / (self.calls_planned + 1)
+            arrival_rate = self.planned_in(interval) * ratio / self.interval
+            total, count = self.handle_times[ad_type]
+            stats = erlang.QueueStats(arrival_rate, total / count, self.advisers[ad_type], renege)
+            self.stats[(ad_type, renege)] = stats
+
+            if oo.record_call_centre_intervals:
+                self.rep.output_data['Call_centre_intervals'].append(oo.call_centre_intervals(self.rep.reps,
+                                                                                              interval * self.interval,
+                                                                                              ad_type,
+                                                                                              stats.advisers,
+                                                                                              stats.arrival_rate,
+                                                                                              stats.handle_time,
+                                                                                              renege,
+                                                                                              stats.p_wait(),
+                                                                                              stats.p_abandon,
+                                                                                              stats.mean_answered_wait()))
+
+        return self.stats[(ad_type, renege)]
+
+    def call(self, ad_type, renege, rnd):
+        """returns the wait of a caller to the passed adviser type with the passed renege time, drawn with the passed
+        random stream, and the call if answered or None if the caller hangs up"""
+
+        wait, answered = self.queue_stats(ad_type, renege).wait(rnd.uniform(0, 1))
+
+        if not answered:
+            return wait, None
+
+        return wait, AnsweredCall(self.adviser_inputs[ad_type], ad_type, self.env.now + wait)
+
+    def put(self, call):
+        """records the handle time of the passed answered call once it is finished"""
+
+        self.handle_times[call.type][0] += self.env.now - call.answered_at
+        self.handle_times[call.type][1] += 1
 
 
 class LetterPhase(object):
@@ -104,12 +246,8 @@ class LetterPhase(object):
 
     def fu_letter(self):
 
-        temp_letter_list = [household for household in self.district.households
-                           if (not self.blanket and household.hh_type in self.targets and not household.responded) or \
-                    (self.blanket and household.hh_type in self.targets)]
-
-        # order by priority
-        temp_letter_list.sort(key=lambda hh: hh.priority, reverse=False)
+        # ordered by priority
+        temp_letter_list = self.district.hh_table.to_send_letters(self.targets, self.blanket)
 
         for i in range(self.period):
             current_letter_day = temp_letter_list[i::self.period]
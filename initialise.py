@@ -2,12 +2,12 @@
 import district
 import hq
 import helper as h
-import simpy
 import sys
 from collections import defaultdict
 import output_options as oo
 import response_profiles as rp
 import call_profiles as cp
+import sampling
 
 
 class Rep(object):
@@ -15,7 +15,8 @@ class Rep(object):
 
     def __init__(self, env, input_data, output_data, passive_summary, passive_totals, active_summary, active_totals,
                  active_paper_summary, active_paper_totals, visit_summary, visit_totals, time_summary, time_totals,
-                 paper_summary, paper_totals, rnd, sim_hours, start_date, census_day, out_path, max_output_file_size):
+                 paper_summary, paper_totals, streams, sim_hours, start_date, census_day, out_path, max_output_file_size,
+                 memory_snapshots=None):
 
         # values passed to the class
         self.env = env
@@ -33,12 +34,13 @@ class Rep(object):
         self.time_totals = time_totals
         self.paper_summary = paper_summary
         self.paper_totals = paper_totals
-        self.rnd = rnd
+        self.streams = streams  # random number streams for each purpose
         self.sim_hours = sim_hours
         self.start_date = start_date
         self.census_day = census_day
         self.output_path = out_path
         self.max_output_file_size = max_output_file_size
+        self.memory_snapshots = memory_snapshots  # takes tracemalloc snapshots if set
 
         # variables created within the class - belonging to it
         self.run = self.input_data['run_id']
@@ -57,13 +59,23 @@ class Rep(object):
         ad_inputs = self.input_data['advisers']
         self.total_ad_instances = sum([ad_inputs[adviser]["number"] for adviser in ad_inputs])
         if self.total_ad_instances > 0:
-            self.adviser_store = simpy.FilterStore(self.env, capacity=self.total_ad_instances)
+            if h.str2bool(self.input_data.get('analytic call centre', False)):
+                # waits drawn from a queue model rather than simulated
+                self.call_centre = hq.AnalyticCallCentre(self, ad_inputs)
+            else:
+                self.call_centre = hq.CallCentre(self.env, ad_inputs)
 
         # generate profiles to use
         self.response_df = rp.response_profiles_2011_all(self.census_day)
         self.call_df = cp.call_profiles_2011_all()
         self.call_day_df = cp.call_profiles_day_2011()
 
+        # samplers of each profile - returns after reminders use the call profile from 9am
+        self.response_samplers = sampling.column_samplers(self.response_df)
+        self.call_samplers = sampling.column_samplers(self.call_df)
+        self.call_day_samplers = sampling.column_samplers(self.call_day_df)
+        self.return_time_samplers = sampling.column_samplers(self.call_day_df, 18)
+
         # create common resources
         # self.create_advisers(self.input_data['advisers'], "")  # Call centre
         self.adviser_types = defaultdict(dict)
@@ -71,8 +83,14 @@ class Rep(object):
             self.create_advisers()
             self.add_to_store()
 
+        if self.memory_snapshots:
+            self.memory_snapshots.take('rep setup')
+
         self.create_districts()  # initialises districts
 
+        if self.memory_snapshots:
+            self.memory_snapshots.take('districts created')
+
     def create_advisers(self):
 
         id_num = 0
@@ -97,7 +115,7 @@ class Rep(object):
                 print("Error when creating adviser type", adviser_type, " in run: ", self.run)
                 sys.exit()
 
-    # add advisers to store
+    # add advisers to the call centre
     def add_to_store(self):
         # print(len(self.ad_avail))
 
@@ -107,9 +125,11 @@ class Rep(object):
             self.adviser_types[adviser.type]['start_time'] = adviser.start_sim_time
             self.adviser_types[adviser.type]['end_time'] = adviser.end_sim_time
             self.adviser_types[adviser.type]['availability'] = adviser.set_avail_sch
+            self.adviser_types[adviser.type]['calendar'] = adviser.calendar
 
-            # add it to the store
-            self.adviser_store.put(adviser)
+            # add it to the call centre
+            if not self.call_centre.analytic:
+                self.call_centre.put(adviser)
 
     def create_districts(self):
 
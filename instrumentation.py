@@ -0,0 +1,134 @@
+"""module used to measure what drives the event volume of the simulation. Turned on by record_engine_stats in output
+options. The instrumented environment counts the events scheduled and processed by each type of process, such as
+Household.household_returns or CensusOfficer.co_working_test, and records the events processed, wall time and event queue length
+for each simulated day. The counts are added to the output of each rep"""
+
+import time
+from collections import defaultdict
+import simpy
+from simpy.core import NORMAL
+from simpy.events import Process
+import output_options as oo
+
+
+def process_name(process):
+    """returns the qualified name of the generator run by the passed process, e.g. Household.contact"""
+
+    return getattr(process._generator, '__qualname__', type(process._generator).__name__)
+
+
+def callback_owner(callback):
+    """returns the simulation object the passed callback is a method of, or None if it is not a method or belongs to
+    simpy itself"""
+
+    owner = getattr(callback, '__self__', None)
+
+    if owner is None or isinstance(owner, type) or type(owner).__module__.split('.')[0] == 'simpy':
+        return None
+
+    return owner
+
+
+class InstrumentedEnvironment(simpy.Environment):
+    """simpy environment that keeps counts of the events scheduled and processed by each type of process. Events
+    scheduled outside a process are counted against setup. Events that resume no process are counted against the
+    method of any simulation object in their callbacks, otherwise their own type or the process that has finished.
+    The wall time of the first day is measured from the first event, not from when the environment is created"""
+
+    def __init__(self, initial_time=0):
+
+        super().__init__(initial_time)
+
+        self.scheduled = defaultdict(int)
+        self.processed = defaultdict(int)
+
+        # events, wall time and queue length for each simulated day
+        self.days = []
+        self.day = int(initial_time // 24)
+        self.day_events = 0
+        self.day_start = None  # set when the first event is processed so rep setup is not counted
+        self.day_queue_length = 0
+        self.day_max_queue_length = 0
+
+    def schedule(self, event, priority=NORMAL, delay=0):
+
+        if self.active_process is not None:
+            self.scheduled[process_name(self.active_process)] += 1
+        else:
+            self.scheduled['setup'] += 1
+
+        super().schedule(event, priority, delay)
+
+    def step(self):
+
+        if self.day_start is None:
+            # the simulation starts - whether from run or from steps taken by the caller
+            self.day_start = time.perf_counter()
+            self.day_queue_length = len(self._queue)
+
+        if self._queue:
+            event_time, _, _, event = self._queue[0]
+
+            if event_time // 24 > self.day:
+                self.end_day(int(event_time // 24))
+
+            if isinstance(event, Process):
+                # a process that has finished with nothing waiting on it
+                name = process_name(event) + ' finished'
+            else:
+                name = type(event).__name__
+
+            owner = None
+            for callback in event.callbacks or []:
+                if isinstance(getattr(callback, '__self__', None), Process):
+                    name = process_name(callback.__self__)
+                    break
+                elif owner is None and callback_owner(callback) is not None:
+                    # a method of a simulation object added straight to the callbacks, e.g. Household.action
+                    owner = getattr(callback, '__qualname__', type(callback_owner(callback)).__name__)
+            else:
+                if owner is not None:
+                    name = owner
+            self.processed[name] += 1
+
+            self.day_events += 1
+            self.day_max_queue_length = max(self.day_max_queue_length, len(self._queue))
+
+        super().step()
+
+    def end_day(self, next_day):
+        """records the current simulated day and moves on to the passed day. Days with no events are recorded too"""
+
+        time_now = time.perf_counter()
+        if self.day_start is None:
+            self.day_start = time_now
+        self.days.append((self.day, self.day_events, time_now - self.day_start, self.day_queue_length,
+                          self.day_max_queue_length))
+
+        for day in range(self.day + 1, next_day):
+            self.days.append((day, 0, 0, len(self._queue), len(self._queue)))
+
+        self.day = next_day
+        self.day_events = 0
+        self.day_start = time_now
+        self.day_queue_length = len(self._queue)
+        self.day_max_queue_length = len(self._queue)
+
+    def record(self, output_data, rep_id):
+        """adds the counts for the rep to the passed output data"""
+
+        self.end_day(self.day + 1)
+
+        for name in sorted(set(self.scheduled) | set(self.processed)):
+            output_data['Engine_events'].append(oo.engine_events(rep_id,
+                                                                 name,
+                                                                 self.scheduled[name],
+                                                                 self.processed[name]))
+
+        for day, events, wall_time, queue_length, max_queue_length in self.days:
+            output_data['Engine_days'].append(oo.engine_days(rep_id,
+                                                             day,
+                                                             events,
+                                                             wall_time,
+                                                             queue_length,
+                                                             max_queue_length))
@@ -0,0 +1,89 @@
+"""module used to find what uses the memory of a rep. When turned on, tracemalloc snapshots are taken at each phase of
+a rep - once the rep is set up, once the districts are created, on census day, at the end of the simulation and once
+the output is written - and a report of the largest allocation sites at each phase, and the growth between phases,
+is saved to the memory folder of the simulation output"""
+
+import os
+import tracemalloc
+
+memory_folder_name = 'memory'
+report_lines = 15  # allocation sites listed for each phase
+frames = 1  # frames of traceback stored for each allocation - more frames give more detail but use more memory
+
+# set in each worker by init_worker - snapshots are only taken when True
+profile_memory = False
+
+
+def init_worker(profile):
+    """sets if the current process takes memory snapshots of its tasks"""
+
+    global profile_memory
+    profile_memory = profile
+
+
+def report_path(out_path, run_id, rep_id):
+    """returns the path of the memory report of the passed run/rep"""
+
+    return os.path.join(out_path, memory_folder_name, 'run_' + str(run_id) + '_rep_' + str(rep_id) + '.txt')
+
+
+class PhaseSnapshots(object):
+    """takes and reports on tracemalloc snapshots at each phase of a rep"""
+
+    def __init__(self, households):
+
+        self.households = households
+        self.snapshots = []
+        tracemalloc.start(frames)
+
+    def take(self, phase):
+        """takes a snapshot labelled with the passed phase"""
+
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>')])
+        current, peak = tracemalloc.get_traced_memory()
+        self.snapshots.append((phase, snapshot, current, peak))
+
+    def census_day(self, env, census_day):
+        """simpy process that takes a snapshot at the start of census day"""
+
+        yield env.timeout(census_day * 24)
+        self.take('census day')
+
+    def stop(self):
+        """stops tracing if not already stopped"""
+
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def report(self, path):
+        """stops tracing and writes the report to the passed path"""
+
+        self.stop()
+
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, 'w') as outfile:
+            outfile.write('Households: ' + str(self.households) + '\n\n')
+
+            outfile.write('{:<20}{:>16}{:>16}{:>20}\n'.format('phase', 'traced MB', 'peak MB', 'bytes per household'))
+            for phase, snapshot, current, peak in self.snapshots:
+                outfile.write('{:<20}{:>16.1f}{:>16.1f}{:>20.0f}\n'.format(phase, current / 1024 ** 2,
+                                                                            peak / 1024 ** 2,
+                                                                            current / max(self.households, 1)))
+
+            previous = None
+            for phase, snapshot, current, peak in self.snapshots:
+                outfile.write('\n' + phase + ' - largest allocation sites\n')
+                for stat in snapshot.statistics('lineno')[:report_lines]:
+                    outfile.write(str(stat) + '\n')
+
+                if previous:
+                    outfile.write('\n' + phase + ' - largest growth since ' + previous[0] + '\n')
+                    for stat in snapshot.compare_to(previous[1], 'lineno')[:report_lines]:
+                        outfile.write(str(stat) + '\n')
+
+                previous = (phase, snapshot)
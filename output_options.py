@@ -14,6 +14,11 @@ hh_record = namedtuple('hh_record', ['rep', 'district', 'LA', 'lsoa11cd', 'hh_ty
 warnings = namedtuple('Warnings', ['rep', 'warning', 'detail'])
 initial_action = namedtuple('Initial_action', ['type', 'digital', 'time', 'engaged'])
 hh_geography = namedtuple('hh_geography', ['la', 'lsoa', 'district_name', 'hh_type', 'digital'])
+engine_events = namedtuple('Engine_events', ['rep', 'process', 'scheduled', 'processed'])
+engine_days = namedtuple('Engine_days', ['rep', 'day', 'events', 'wall_time', 'queue_length', 'max_queue_length'])
+call_centre_intervals = namedtuple('Call_centre_intervals', ['rep', 'time', 'adviser_type', 'advisers', 'arrival_rate',
+                                                             'handle_time', 'renege', 'p_wait', 'p_abandon',
+                                                             'mean_wait'])
 
 """
 record_generic_output = True
@@ -49,6 +54,8 @@ record_return_received = True
 record_responded = True
 record_hh_record = True
 record_key_info = True
+record_engine_stats = True
+record_call_centre_intervals = True
 """
 record_passive_summary = True
 record_active_summary = True
@@ -90,3 +97,5 @@ record_return_received = False
 record_responded = False
 record_hh_record = True
 record_key_info = False
+record_engine_stats = False
+record_call_centre_intervals = True
@@ -7,6 +7,8 @@ import numpy as np
 from collections import defaultdict
 import datetime as dt
 import math
+import statistics
+import adaptive
 from bokeh.plotting import ColumnDataSource, figure
 from bokeh.io import output_file, save
 from bokeh.models import DatetimeTickFormatter, HoverTool
@@ -625,51 +627,174 @@ def csv_to_pandas(output_path, output_type):
     return data_dict
 
 
-def produce_rep_results(current_path):
-    """combines the summary files producing csv files of the results for all districts for each rep and the average
-    when all reps are combined. these can then be plotted separately (distribution), combined or both"""
-
-    # go through the folders equal times for number of reps run
-    # for each folder that is at district level pick out relevant rep
-
-    #current_path = os.path.join(current_path, 'summary')
-
-    folders = list(os.walk(current_path))  # a list of all the folders in the summary results
-    for folder in folders:
-        os.chdir(folder[0])
-
-        if glob.glob('*.csv'):  # search each folder for csv files
-            file_list = glob.glob('*.csv')
-            total_reps = len(file_list)
-            os.chdir("..")  # when csv files found step up a level
-            districts = len([direc for direc in os.listdir(os.getcwd()) if os.path.isdir(direc)])
-            # then for number of reps pull out relavent rep for each district and add together
-            df_totals = pd.DataFrame()
-            for rep in range(1, total_reps+1):
-                # could have a dict with number of dataframes equal to reps and go through only once...
-                # e.g. add all reps to dict with df before moving on...
-                df = pd.DataFrame()
-                for district in range(1, districts+1):
-                    df_to_add = pd.read_csv(os.path.join(str(district), str(rep) + ".csv"),  index_col=0)
-                    np.fromfile(os.path.join(str(district), str(rep) + ".csv"))
-                    os.remove(os.path.join(str(district), str(rep) + ".csv"))
-                    df = df.add(df_to_add, fill_value=0)
-
-                df_totals = df_totals.add(df, fill_value=0)  # add to overall record (all districts combined)
-                if not os.path.isdir('reps_combined'):
-                    os.makedirs('reps_combined')
-                df.to_csv(os.path.join('reps_combined', 'rep_' + str(rep) + ".csv"))
-
-            df_totals /= total_reps
-            df_totals.to_csv('average.csv')
-
-    # clean up empty folders
-    for dirpath, dirnames, files in os.walk(current_path):
-        if not dirnames and not files:
-            os.rmdir(dirpath)
-
-    # and change the working directory back to the start directory
-    os.chdir(current_path)
+class SummaryTotals(object):
+    """running totals of the summary data returned by each run/rep of a simulation. Once every run of a rep has been
+    added the totals for that rep, across all runs, are written to file and only the totals needed for the averages
+    are kept. If hold_reps is True the rep totals are kept until the end, for use when the number of reps of each run
+    is not known up front"""
+
+    def __init__(self, summary_path, reps_per_run, hold_reps=False):
+
+        self.summary_path = summary_path
+        self.hold_reps = hold_reps
+        self.runs_left = defaultdict(int)  # runs still to be added for each rep
+
+        for run, reps in reps_per_run.items():
+            for rep in reps:
+                self.runs_left[rep] += 1
+
+        self.rep_totals = {}  # totals across all runs for reps that are not yet written
+        self.run_totals = {}  # totals across all reps for each run
+        self.run_reps = defaultdict(int)  # reps added for each run
+        self.rep_measures = []  # overall total of each totals dict for each run/rep
+
+    @staticmethod
+    def add_arrays(totals, summaries):
+        """adds the passed summary arrays, of the form {dict name: {key: (codes, values)}}, to the passed totals"""
+
+        for dict_name, keys in summaries.items():
+            for key, (codes, values) in keys.items():
+                key_totals = totals.setdefault(dict_name, {}).setdefault(key, {})
+
+                for code, row in zip(codes, values):
+                    if code not in key_totals:
+                        key_totals[code] = np.array(row, dtype=float)
+                    else:
+                        # runs can cover a different number of days
+                        current = key_totals[code]
+                        if len(row) > len(current):
+                            current = np.pad(current, (0, len(row) - len(current)), 'constant')
+                        current[:len(row)] += row
+                        key_totals[code] = current
+
+    def add(self, run, rep, summaries):
+        """adds the summary arrays returned by a single run/rep"""
+
+        self.add_arrays(self.rep_totals.setdefault(rep, {}), summaries)
+        self.add_arrays(self.run_totals.setdefault(run, {}), summaries)
+        self.run_reps[run] += 1
+        self.runs_left[rep] -= 1
+
+        measures = {'run': run, 'rep': rep}
+        for dict_name, keys in summaries.items():
+            if dict_name.endswith('_totals') and 'la' in keys:
+                measures[dict_name] = float(np.sum(keys['la'][1]))
+        self.rep_measures.append(measures)
+
+        if self.runs_left[rep] == 0 and not self.hold_reps:
+            # rep is complete so write it out and keep only what is needed for the average
+            self.write_totals(self.rep_totals.pop(rep), 'reps_combined', 'rep_' + str(rep) + '.csv')
+
+    @staticmethod
+    def to_summaries(totals):
+        """converts totals back to the summary array format used by add_arrays"""
+
+        return {dict_name: {key: (list(key_totals.keys()), list(key_totals.values()))
+                            for key, key_totals in keys.items()}
+                for dict_name, keys in totals.items()}
+
+    def write_totals(self, totals, folder, filename, divide_by=1):
+        """writes the passed totals to a csv file for each summary type and key, in the same format as the summary
+        files produced by the simulation, optionally dividing them by the passed value"""
+
+        for dict_name, keys in totals.items():
+            for key, key_totals in keys.items():
+
+                out_path = os.path.join(self.summary_path, dict_name, key)
+                if folder:
+                    out_path = os.path.join(out_path, folder)
+                if not os.path.isdir(out_path):
+                    os.makedirs(out_path)
+
+                codes = sorted(key_totals.keys())
+                days = max([len(key_totals[code]) for code in codes], default=0)
+                values = np.zeros((len(codes), days))
+                for i, code in enumerate(codes):
+                    values[i, :len(key_totals[code])] = key_totals[code]
+
+                pd.DataFrame(values / divide_by, index=codes).to_csv(os.path.join(out_path, filename))
+
+    def write(self):
+        """writes any held rep totals, the average across the reps of each run and the overall average, the sum of
+        the run averages, to file. Runs may have a different number of reps"""
+
+        for rep, rep_totals in sorted(self.rep_totals.items()):
+            self.write_totals(rep_totals, 'reps_combined', 'rep_' + str(rep) + '.csv')
+        self.rep_totals = {}
+
+        overall_totals = {}
+        for run, run_totals in self.run_totals.items():
+            self.write_totals(run_totals, 'runs_combined', 'run_' + str(run) + '.csv', self.run_reps[run])
+
+            run_average = self.to_summaries(run_totals)
+            for keys in run_average.values():
+                for key, (codes, values) in keys.items():
+                    keys[key] = (codes, [row / self.run_reps[run] for row in values])
+            self.add_arrays(overall_totals, run_average)
+
+        self.write_totals(overall_totals, '', 'average.csv')
+
+        if not os.path.isdir(self.summary_path):
+            os.makedirs(self.summary_path)
+        rep_measures = pd.DataFrame(self.rep_measures)
+        if not rep_measures.empty:
+            rep_measures = rep_measures.sort_values(['run', 'rep'])
+        rep_measures.to_csv(os.path.join(self.summary_path, 'rep_totals.csv'), index=False)
+
+
+def paired_differences(summary_path, baseline=None, antithetic=False, confidence=95):
+    """compares the overall totals in rep_totals.csv of each run with those of the baseline run, by default the
+    first, rep by rep. Runs using common random numbers share the seed of each rep so the paired differences vary far
+    less than the runs do. If antithetic is True each pair of reps is averaged first. Writes the mean difference and
+    the confidence half width of the paired differences, and of the difference if the runs were independent, to
+    paired_differences.csv"""
+
+    df = pd.read_csv(os.path.join(summary_path, 'rep_totals.csv'), dtype={'run': str})
+
+    if antithetic:
+        df['rep'] = (df['rep'] + 1) // 2
+        df = df.groupby(['run', 'rep'], as_index=False).mean()
+
+    runs = sorted(df['run'].unique(), key=int)
+    if baseline is None:
+        baseline = runs[0]
+
+    measures = [col for col in df.columns if col not in ['run', 'rep']]
+    base = df[df['run'] == str(baseline)].set_index('rep')
+
+    rows = []
+    for run in runs:
+        if run == str(baseline):
+            continue
+
+        other = df[df['run'] == run].set_index('rep')
+        reps = base.index.intersection(other.index)
+
+        for measure in measures:
+            differences = list(other.loc[reps, measure] - base.loc[reps, measure])
+            base_values = list(base[measure])
+            other_values = list(other[measure])
+
+            if min(len(base_values), len(other_values)) > 1:
+                independent_half_width = (adaptive.t_quantile(0.5 + confidence / 200,
+                                                               min(len(base_values), len(other_values)) - 1) *
+                                          math.sqrt(statistics.variance(base_values) / len(base_values) +
+                                                    statistics.variance(other_values) / len(other_values)))
+            else:
+                independent_half_width = math.inf
+
+            rows.append({'run': run,
+                         'baseline': baseline,
+                         'measure': measure,
+                         'reps': len(reps),
+                         'mean_difference': statistics.mean(differences) if differences else math.nan,
+                         'paired_half_width': adaptive.half_width(differences, confidence),
+                         'independent_half_width': independent_half_width})
+
+    output = pd.DataFrame(rows)
+    output.to_csv(os.path.join(summary_path, 'paired_differences.csv'), index=False)
+
+    return output
 
 
 def plot_summary(summary_path, summary_outpath, output_name, reps=False, average=True, cumulative=True, individual=False,
@@ -0,0 +1,20 @@
+"""module used to keep the response and call profiles built by a process so each is read from file and built once per
+worker rather than once per rep. Profiles are keyed on the file they are built from, the time the file was last
+modified and the arguments used to build them, so a file that is edited is read again. Cached profiles are shared by
+every rep run by the process so must not be changed"""
+
+import os
+
+cache = {}
+
+
+def cached_profile(input_path, build, *args):
+    """returns the profile built by calling the passed function with the passed input path and args, building it only
+    if it is not already cached"""
+
+    key = (build.__module__, build.__name__, input_path, os.path.getmtime(input_path)) + args
+
+    if key not in cache:
+        cache[key] = build(input_path, *args)
+
+    return cache[key]
@@ -0,0 +1,104 @@
+"""module used to profile the simulation under a realistic load. When turned on, each worker runs cProfile around
+every run/rep it is given and saves the profile to the profiles folder of the simulation output. Once a simulation is
+complete the profiles are merged into a single report ranked by cumulative time, with a section for each of the main
+modules of the model"""
+
+import cProfile
+import glob
+import io
+import os
+import pstats
+
+profile_folder_name = 'profiles'
+report_modules = ['household', 'FFU', 'hq', 'district', 'helper']
+report_lines = 30  # functions listed in each section of the report
+
+# set in each worker by init_worker - profiles are only recorded when True
+profile_tasks = False
+
+
+def init_worker(profile):
+    """sets if the current process profiles its tasks"""
+
+    global profile_tasks
+    profile_tasks = profile
+
+
+def profile_call(profile_path, func, *args):
+    """calls the passed function with the passed args and, if profiling is turned on, saves a profile of the call to
+    the passed path. Returns the result of the call"""
+
+    if not profile_tasks:
+        return func(*args)
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args)
+    finally:
+        if not os.path.isdir(os.path.dirname(profile_path)):
+            os.makedirs(os.path.dirname(profile_path), exist_ok=True)
+        profiler.dump_stats(profile_path)
+
+
+def task_profile_path(out_path, run_id, rep_id):
+    """returns the path of the profile of the passed run/rep"""
+
+    return os.path.join(out_path, profile_folder_name, 'run_' + str(run_id) + '_rep_' + str(rep_id) + '.prof')
+
+
+def module_times(stats):
+    """returns a dict of the total time spent in the functions of each module in the passed stats"""
+
+    times = {}
+    for (filename, lineno, function), (cc, nc, tt, ct, callers) in stats.stats.items():
+        if filename == '~':
+            module = 'built-in'
+        else:
+            module = os.path.splitext(os.path.basename(filename))[0]
+        times[module] = times.get(module, 0) + tt
+
+    return times
+
+
+def merge_profiles(out_path):
+    """merges the profiles of every run/rep in the passed simulation output folder into merged.prof and writes a
+    report, ranked by cumulative time, to profile_report.txt. Returns the merged stats or None if there are none"""
+
+    profile_path = os.path.join(out_path, profile_folder_name)
+    file_list = sorted(glob.glob(os.path.join(profile_path, 'run_*.prof')))
+
+    if not file_list:
+        return None
+
+    stats = pstats.Stats(file_list[0], stream=io.StringIO())
+    for file in file_list[1:]:
+        stats.add(file)
+
+    stats.dump_stats(os.path.join(profile_path, 'merged.prof'))
+
+    report = io.StringIO()
+    stats.stream = report
+
+    report.write('Profiles merged: ' + str(len(file_list)) + '\n\n')
+
+    # own time of each module, largest first
+    times = module_times(stats)
+    total_time = sum(times.values())
+    report.write('Time by module\n')
+    for module, module_time in sorted(times.items(), key=lambda x: x[1], reverse=True)[:report_lines]:
+        report.write('{:<40}{:>12.3f}{:>8.1f}%\n'.format(module, module_time,
+                                                        module_time / total_time * 100 if total_time else 0))
+    report.write('\n')
+
+    report.write('All modules\n')
+    stats.sort_stats('cumulative').print_stats(report_lines)
+
+    for module in report_modules:
+        report.write(module + '\n')
+        # restrict to functions defined in the module
+        stats.sort_stats('cumulative').print_stats(r'[\\/]' + module + r'\.py:', report_lines)
+
+    with open(os.path.join(profile_path, 'profile_report.txt'), 'w') as outfile:
+        outfile.write(report.getvalue())
+
+    return stats
@@ -0,0 +1,91 @@
+"""module used to create the random number streams used by each replication. Used to reduce the variance of the
+differences between runs that are being compared.
+
+Set by adding an entry of the following format to each run in the input JSON that is to be compared:
+
+    "variance reduction": {"common random numbers": "True", "antithetic": "True"}
+
+With common random numbers the seed of each rep depends only on the rep, so runs share seeds, and each purpose, such
+as household creation or visits, draws from its own stream. The same households then make the same draws in each run
+regardless of any differences in the draws made for other purposes. With antithetic set the even reps reuse the seed
+of the rep before and mirror every draw so the reps are paired.
+
+Where a large number of draws are made together, such as when households are created, a numpy generator seeded from
+the relevant stream is used so the draws can be made in batches."""
+
+import random
+import numpy as np
+import helper as h
+
+stream_names = ['household', 'response', 'call', 'visit', 'letter']
+
+
+class AntitheticRandom(random.Random):
+    """random number generator that returns 1 - u for each uniform u drawn by the standard generator. Every
+    distribution built on random() is mirrored as a result"""
+
+    def random(self):
+        return 1 - super().random()
+
+
+class BatchRandom(object):
+    """numpy generator used to draw batches of random numbers. If antithetic is True every draw is mirrored, as the
+    draws of an AntitheticRandom stream are"""
+
+    def __init__(self, seed, antithetic=False):
+
+        self.generator = np.random.RandomState(seed)
+        self.antithetic = antithetic
+
+    def random(self, size):
+        u = self.generator.random_sample(size)
+        return 1 - u if self.antithetic else u
+
+    def uniform(self, low, high, size):
+        return low + (high - low) * self.random(size)
+
+    def normal(self, mean, sd, size):
+        z = self.generator.standard_normal(size)
+        return mean + sd * (-z if self.antithetic else z)
+
+
+def batch_generator(stream):
+    """returns a batch generator seeded from, and so following the seed of, the passed stream"""
+
+    return BatchRandom(stream.getrandbits(32), isinstance(stream, AntitheticRandom))
+
+
+class RandomStreams(object):
+    """the random number streams used by a rep, one for each purpose in stream_names. By default every purpose
+    shares a single stream seeded as a single generator would be. If separate is True each purpose has its own
+    stream seeded from the seed of the rep and the purpose"""
+
+    def __init__(self, seed, separate=False, antithetic=False):
+
+        generator = AntitheticRandom if antithetic else random.Random
+        shared = generator(str(seed))
+
+        for name in stream_names:
+            if separate:
+                setattr(self, name, generator(str(seed) + ' ' + name))
+            else:
+                setattr(self, name, shared)
+
+
+def variance_reduction(run_input):
+    """returns if the passed run uses common random numbers and antithetic reps"""
+
+    if 'variance reduction' not in run_input:
+        return False, False
+
+    options = run_input['variance reduction']
+
+    return h.str2bool(options['common random numbers']), h.str2bool(options['antithetic'])
+
+
+def rep_streams(run_input, seed):
+    """returns the random number streams for the passed run/rep"""
+
+    common, antithetic = variance_reduction(run_input)
+
+    return RandomStreams(seed, separate=common, antithetic=antithetic and run_input['rep_id'] % 2 == 0)
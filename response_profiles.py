@@ -2,8 +2,10 @@
 profiles to be sampled"""
 
 
+import numpy as np
 import pandas as pd
 import os
+import profile_cache
 
 
 def response_profiles_2011_all(census_day):
@@ -19,19 +21,24 @@ def response_profiles_2011_all(census_day):
     # generates a profile to use for response rates based on 2011 data
 
     input_path = os.path.join(os.getcwd(), 'raw_inputs', 'summary_returns_2017.csv')
+
+    return profile_cache.cached_profile(input_path, read_response_profiles, census_day)
+
+
+def read_response_profiles(input_path, census_day):
+    # reads and builds the profile returned by response_profiles_2011_all
+
     responses = pd.read_csv(input_path)
     # make all headers lowercase as they are used as keys
     responses.columns = map(str.lower, responses.columns)
     # don't need these columns
     responses.drop(['date', 'day'], axis=1, inplace=True)
-    responses_only = responses
 
     # do a reduction to better represent self response in 2011
-    total_days = len(responses_only)
-    for i in range(total_days):
-        if i > census_day:
-            reduction = (i - census_day)/(total_days-census_day)
-            responses_only.iloc[i] *= (1-reduction)
+    total_days = len(responses)
+    days = np.arange(total_days)
+    reduction = np.where(days > census_day, (days - census_day)/(total_days-census_day), 0)
+    responses_only = responses.multiply(1-reduction, axis=0)
 
     responses_only['generic'] = responses_only.sum(axis=1)
 
@@ -46,26 +53,13 @@ def response_profiles_2011_all(census_day):
     return cum_prob_response
 
 
-def sample_day_2011_all(rep, hh_type, generic=True):
+def sample_days_2011_all(rep, hh_type, rnd, size, generic=True):
+    """returns an array of the passed number of response days drawn with the passed batch generator from the generic
+    profile or, if generic is False, that of the passed hh type"""
 
     if generic:
-        # use first col
-        rt = rep.response_df["generic"]
-
+        sampler = rep.response_samplers["generic"]
     else:
-        # use col specific to hh type
-        rt = rep.response_df[hh_type]
-
-    r = rep.rnd.uniform(0, 1)
-
-    return min([index for index, value in enumerate(rt) if value > r])
-
-
-
-
-
-
-
-
-
+        sampler = rep.response_samplers[hh_type]
 
+    return sampler.sample_batch(rnd, size)
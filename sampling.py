@@ -0,0 +1,41 @@
+"""module used to sample the empirical distributions the response, call and return time profiles are made of. A
+sampler is built once for each profile column and returns the index of the first value of the cumulative distribution
+that is greater than a uniform draw. Initial actions are drawn as a batch and return times one draw at a time"""
+
+from bisect import bisect_right
+import numpy as np
+
+
+class EmpiricalSampler(object):
+    """samples the passed cumulative distribution with a binary search of its values"""
+
+    def __init__(self, cum_prob):
+
+        self.cum_prob = np.asarray(cum_prob, dtype=float).ravel()
+        self.cum_prob_list = self.cum_prob.tolist()  # searched by single draws of return times as faster than arrays
+
+    def __len__(self):
+        return len(self.cum_prob)
+
+    def sample(self, rnd):
+        """returns the index of a single sample drawn with the passed random stream. Used for the return times of
+        households, which are drawn as each return is sent"""
+
+        return bisect_right(self.cum_prob_list, rnd.uniform(0, 1))
+
+    def sample_batch(self, rnd, size):
+        """returns an array of the indices of the passed number of samples drawn with the passed batch generator"""
+
+        return self.sample_values(rnd.random(size))
+
+    def sample_values(self, r):
+        """returns an array of the indices of the samples given by the passed array of uniform draws"""
+
+        return np.searchsorted(self.cum_prob, r, side='right')
+
+
+def column_samplers(df, start=0):
+    """returns a dict of a sampler for each column of the passed dataframe of cumulative distributions. If passed a
+    start row the distributions are sampled from that row on"""
+
+    return dict((column, EmpiricalSampler(df[column].values[start:])) for column in df.columns)
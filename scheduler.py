@@ -0,0 +1,99 @@
+"""module used to estimate how long each run/rep task will take so the longest tasks can be dispatched to the pool
+first. Estimates are made from the run input and refined, between batches, using the measured duration of
+previous tasks"""
+
+import json
+import os
+import hashlib
+
+
+# relative weights of the features of a run that drive the time taken by a rep - measured on the test input
+household_weight = 1
+co_weight = 60
+letter_weight = 0.4
+
+
+def run_fingerprint(run_input):
+    """returns a key that identifies the passed run regardless of which file, run or rep it comes from"""
+
+    run_copy = {key: value for key, value in run_input.items()
+                if key not in ['run_id', 'rep_id', 'replication seeds', 'replications']}
+
+    return hashlib.md5(json.dumps(run_copy, sort_keys=True).encode()).hexdigest()
+
+
+def estimate_cost(run_input):
+    """returns an estimate, in arbitrary units, of the cost of a single rep of the passed run. The cost of a rep is
+    dominated by the number of households, the number of census officers and the number of households sent letters.
+    As households are allocated to lsoa in a single pass the number of lsoa adds little"""
+
+    cost = 0
+
+    for district in run_input['districts'].values():
+
+        households = sum([hh_value['number'] for hh_value in district['households'].values()])
+        cost += household_weight * households
+
+        if district['census officer']:
+            cost += co_weight * sum([co_value['number'] for co_value in district['census officer'].values()])
+
+        if district['letter_phases']:
+            cost += letter_weight * households * len(district['letter_phases'])
+
+    return cost
+
+
+def load_costs(costs_path):
+    """returns the measured costs of previous batches or an empty record if none exist"""
+
+    if os.path.isfile(costs_path):
+        with open(costs_path) as data_file:
+            return json.load(data_file)
+
+    return {'seconds_per_unit': 0, 'runs': {}}
+
+
+def save_costs(costs_path, costs):
+    """updates the seconds per unit of estimated cost from all measured runs and saves the record"""
+
+    total_units = sum([run['units'] * run['count'] for run in costs['runs'].values()])
+    total_seconds = sum([run['seconds'] for run in costs['runs'].values()])
+
+    if total_units > 0:
+        costs['seconds_per_unit'] = total_seconds / total_units
+
+    with open(costs_path, 'w') as outfile:
+        json.dump(costs, outfile)
+
+
+def record_duration(costs, fingerprint, units, duration):
+    """adds the measured duration of a single rep to the record of costs"""
+
+    if fingerprint not in costs['runs']:
+        costs['runs'][fingerprint] = {'units': units, 'seconds': 0, 'count': 0}
+
+    costs['runs'][fingerprint]['seconds'] += duration
+    costs['runs'][fingerprint]['count'] += 1
+
+
+def expected_duration(costs, fingerprint, units):
+    """returns the expected duration of a single rep. Uses the mean measured time if the run has been seen before
+    otherwise scales the estimated cost by the measured seconds per unit"""
+
+    if fingerprint in costs['runs'] and costs['runs'][fingerprint]['count'] > 0:
+        return costs['runs'][fingerprint]['seconds'] / costs['runs'][fingerprint]['count']
+
+    if costs['seconds_per_unit'] > 0:
+        return units * costs['seconds_per_unit']
+
+    # nothing measured yet so relative order is all that matters
+    return units
+
+
+def longest_first(tasks, task_costs):
+    """returns the passed tasks sorted so the longest expected tasks are dispatched first. task_costs holds the
+    expected duration of each task in the same order as the tasks"""
+
+    order = sorted(range(len(tasks)), key=lambda i: task_costs[i], reverse=True)
+
+    return [tasks[i] for i in order]
@@ -0,0 +1,187 @@
+"""module used to report the progress of a batch while it runs. Each worker sends a periodic heartbeat giving the
+run/rep it is working on, the simulated time reached, the rate simpy events are being processed and its memory use.
+The parent collects these into a progress file and prints a summary line with an overall event rate and ETA"""
+
+import datetime as dt
+import json
+import os
+import queue
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # not available on windows
+    resource = None
+
+heartbeat_interval = 5  # seconds between heartbeats sent by a worker
+events_per_check = 1000  # simpy events processed between checks of the time
+
+# queue heartbeats are sent to - set in each worker by init_worker
+heartbeat_queue = None
+
+
+def init_worker(heartbeats):
+    """sets the queue heartbeats are sent to. Used as the initializer of the pool"""
+
+    global heartbeat_queue
+    heartbeat_queue = heartbeats
+
+
+def current_rss():
+    """returns the resident set size of the current process in MB or None if it can't be found"""
+
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    if resource:
+        # peak rather than current size, in KB on linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    return None
+
+
+def send_heartbeat(run_id, rep_id, sim_time, sim_hours, events, rate, finished=False):
+    """sends a heartbeat to the parent. Heartbeats are dropped rather than slow the simulation down"""
+
+    try:
+        heartbeat_queue.put_nowait({'pid': os.getpid(),
+                                    'run': run_id,
+                                    'rep': rep_id,
+                                    'sim_time': sim_time,
+                                    'sim_hours': sim_hours,
+                                    'events': events,
+                                    'events_per_sec': rate,
+                                    'rss_mb': current_rss(),
+                                    'finished': finished,
+                                    'time': time.time()})
+    except queue.Full:
+        pass
+
+
+def run_env(env, until, run_id, rep_id):
+    """runs the passed simpy environment until the passed time, as env.run does, sending heartbeats as it goes if a
+    heartbeat queue has been set"""
+
+    if heartbeat_queue is None:
+        env.run(until=until)
+        return
+
+    events = 0
+    last_events = 0
+    last_time = time.perf_counter()
+    send_heartbeat(run_id, rep_id, env.now, until, events, 0)
+
+    # events at the until time itself are left for env.run below so the stopping behaviour is unchanged
+    while env.peek() < until:
+        env.step()
+        events += 1
+
+        if events % events_per_check == 0:
+            time_now = time.perf_counter()
+            if time_now - last_time >= heartbeat_interval:
+                send_heartbeat(run_id, rep_id, env.now, until, events,
+                               (events - last_events) / (time_now - last_time))
+                last_events = events
+                last_time = time_now
+
+    env.run(until=until)
+
+    time_now = time.perf_counter()
+    send_heartbeat(run_id, rep_id, env.now, until, events,
+                   (events - last_events) / max(time_now - last_time, 1e-9), finished=True)
+
+
+class ProgressMonitor(threading.Thread):
+    """collects the heartbeats sent by the workers and periodically writes the progress of the batch to file and
+    prints a summary line. The main loop tells the monitor how many tasks there are and how many are complete"""
+
+    def __init__(self, heartbeats, progress_path, total_tasks, interval=30):
+
+        threading.Thread.__init__(self, daemon=True)
+        self.heartbeats = heartbeats
+        self.progress_path = progress_path
+        self.interval = interval
+        self.total_tasks = total_tasks
+        self.tasks_complete = 0
+        self.workers = {}  # latest heartbeat of each worker
+        self.start_time = time.time()
+        self.stopping = threading.Event()
+
+    def task_complete(self):
+        self.tasks_complete += 1
+
+    def add_tasks(self, tasks):
+        self.total_tasks += tasks
+
+    def run(self):
+
+        last_report = time.time()
+
+        while not self.stopping.is_set():
+            try:
+                heartbeat = self.heartbeats.get(timeout=1)
+                self.workers[heartbeat['pid']] = heartbeat
+            except queue.Empty:
+                pass
+
+            if time.time() - last_report >= self.interval:
+                self.report()
+                last_report = time.time()
+
+    def stop(self):
+        """stops the monitor and writes the final state of the batch"""
+
+        self.stopping.set()
+        self.join()
+        self.report(console=False)
+
+    def progress(self):
+        """returns a dict of the current progress of the batch"""
+
+        time_now = time.time()
+        elapsed = time_now - self.start_time
+        active = [heartbeat for heartbeat in self.workers.values()
+                  if not heartbeat['finished'] and time_now - heartbeat['time'] < 2 * max(heartbeat_interval,
+                                                                                          self.interval)]
+
+        # reps still running count towards progress by the proportion of simulated time reached
+        done = self.tasks_complete + sum([heartbeat['sim_time'] / heartbeat['sim_hours'] for heartbeat in active
+                                          if heartbeat['sim_hours'] > 0])
+        fraction = done / self.total_tasks if self.total_tasks > 0 else 0
+
+        eta = None
+        if fraction > 0:
+            eta = str(dt.datetime.now() + dt.timedelta(seconds=elapsed / fraction - elapsed))
+
+        return {'time': str(dt.datetime.now()),
+                'elapsed': elapsed,
+                'tasks_complete': self.tasks_complete,
+                'tasks_total': self.total_tasks,
+                'fraction_complete': fraction,
+                'events_per_sec': sum([heartbeat['events_per_sec'] for heartbeat in active]),
+                'active_workers': len(active),
+                'eta': eta,
+                'workers': [dict(heartbeat, seconds_since_heartbeat=time_now - heartbeat['time'])
+                            for heartbeat in sorted(self.workers.values(), key=lambda x: x['pid'])]}
+
+    def report(self, console=True):
+        """writes the current progress to file and, optionally, prints a summary line"""
+
+        progress = self.progress()
+
+        # write to a temporary file first so the progress file is never seen part written
+        temp_path = self.progress_path + '.tmp'
+        with open(temp_path, 'w') as outfile:
+            json.dump(progress, outfile, indent=1)
+        os.replace(temp_path, self.progress_path)
+
+        if console:
+            print('Progress:', round(progress['fraction_complete'] * 100, 1), 'percent,',
+                  progress['tasks_complete'], 'of', progress['tasks_total'], 'tasks,',
+                  progress['active_workers'], 'workers active,',
+                  int(progress['events_per_sec']), 'events/sec. Projected finish time is:', progress['eta'])